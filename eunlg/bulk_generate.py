@@ -1,14 +1,82 @@
 import argparse
-import datetime
+import itertools
 import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
 from pathlib import Path
-from typing import List, Optional
+from typing import Iterable, List, Optional, Tuple
 
 from service import EUNlgService
 
 log = logging.getLogger(__name__)
 log.setLevel(logging.ERROR)
 
+RANDOM_SEED = 4551546
+
+# (variant, language, dataset, location, outdir)
+Job = Tuple[str, str, str, str, str]
+
+
+@lru_cache(maxsize=None)
+def _get_service() -> EUNlgService:
+    # A single service per process, the document planner is swapped per variant with set_planner()
+    return EUNlgService(random_seed=RANDOM_SEED)
+
+
+def _init_worker() -> None:
+    # Construct the service once per worker process, rather than once per job
+    _get_service()
+
+
+def _out_path(job: Job) -> Path:
+    variant, language, dataset, location, outdir = job
+    return Path(outdir) / "{}-{}-{}-{}.txt".format(variant, language, dataset, location)
+
+
+def _run_one(job: Job) -> Tuple[Job, Optional[float], Optional[Exception]]:
+    variant, language, dataset, location, _ = job
+    try:
+        service = _get_service()
+        if service.planner != variant:
+            service.set_planner(variant)
+        start = time.perf_counter()
+        head, body = service.run_pipeline(language, dataset, location, "country", None)
+        end = time.perf_counter()
+        out_path = _out_path(job)
+        # Write to a temporary file first, s.t. an interrupted job can't leave behind a partial document that a later
+        # run would then skip as already generated. A single write, s.t. the whole document is flushed with one syscall
+        # on close.
+        tmp_path = out_path.with_suffix(".tmp")
+        with tmp_path.open("w") as file_handle:
+            file_handle.write("{}\n{}\n".format(head, body))
+        os.replace(str(tmp_path), str(out_path))
+        return job, end - start, None
+    except Exception as ex:
+        return job, None, ex
+
+
+def _report_results(
+    results: Iterable[Tuple[Job, Optional[float], Optional[Exception]]], job_count: int, verbose: bool
+) -> None:
+    for job_idx, (job, duration, ex) in enumerate(results):
+        variant, language, dataset, location, _ = job
+        if ex is None:
+            if verbose:
+                print(
+                    "{} {} {} {} ({}/{}) Done (t={})".format(
+                        variant, language, dataset, location, job_idx + 1, job_count, duration
+                    )
+                )
+        else:
+            print(
+                "Error with inputs: variant={}, language={}, dataset={}, location={}".format(
+                    variant, language, dataset, location
+                )
+            )
+            print("     ", ex)
+
 
 def generate(
     outdir: str,
@@ -17,52 +85,47 @@ def generate(
     locations: Optional[List[str]] = None,
     variants: Optional[List[str]] = None,
     verbose: bool = True,
+    workers: Optional[int] = None,
+    force: bool = False,
 ) -> None:
     out_dir = Path(outdir)
-    if not out_dir.exists():
-        out_dir.mkdir(parents=True)
+    out_dir.mkdir(parents=True, exist_ok=True)
 
     variants = ["full"] if not variants else variants
+    workers = os.cpu_count() if not workers else workers
 
-    for variant_idx, variant in enumerate(variants):
-        service = EUNlgService(random_seed=4551546, planner=variant)
-        if verbose:
-            print("{} ({}/{})".format(variant, variant_idx + 1, len(variants)))
+    # None means that no filtering is done
+    languages_set = set(languages) if languages else None
+    datasets_set = set(datasets) if datasets else None
+    locations_set = set(locations) if locations else None
 
-        filtered_languages = [lang for lang in service.get_languages() if ((not languages) or (lang in languages))]
-        for language_idx, language in enumerate(filtered_languages):
-            if verbose:
-                print("  {} ({}/{})".format(language, language_idx + 1, len(filtered_languages)))
-
-            filtered_datasets = [ds for ds in service.get_datasets(language) if ((not datasets) or (ds in datasets))]
-            for dataset_index, dataset in enumerate(filtered_datasets):
-                if verbose:
-                    print("    {} ({}/{})".format(dataset, dataset_index + 1, len(filtered_datasets)))
-                filtered_locations = [
-                    loc for loc in service.get_locations(dataset) if ((not locations) or (loc in locations))
-                ]
-                for location_idx, location in enumerate(filtered_locations):
-                    if verbose:
-                        print("      {} ({}/{})".format(location, location_idx + 1, len(filtered_locations)))
-                    try:
-                        start = datetime.datetime.now().timestamp()
-                        head, body = service.run_pipeline(language, dataset, location, "country", None)
-                        end = datetime.datetime.now().timestamp()
-                        out_path = out_dir / "{}-{}-{}-{}.txt".format(variant, language, dataset, location)
-                        with out_path.open("w") as file_handle:
-                            file_handle.write(head)
-                            file_handle.write("\n")
-                            file_handle.write(body)
-                            file_handle.write("\n")
-                            if verbose:
-                                print("      Done (t={})".format(end - start))
-                    except Exception as ex:
-                        print(
-                            "      Error with inputs: variant={}, language={}, dataset={}, location={}".format(
-                                variant, language, dataset, location
-                            )
-                        )
-                        print("     ", ex)
+    # The available languages, datasets and locations don't depend on the planner variant
+    service = _get_service()
+    inputs: List[Tuple[str, str, str]] = []
+    filtered_languages = [lang for lang in service.get_languages() if languages_set is None or lang in languages_set]
+    for language in filtered_languages:
+        filtered_datasets = [ds for ds in service.get_datasets(language) if datasets_set is None or ds in datasets_set]
+        for dataset in filtered_datasets:
+            filtered_locations = [
+                loc for loc in service.get_locations(dataset) if locations_set is None or loc in locations_set
+            ]
+            inputs.extend((language, dataset, location) for location in filtered_locations)
+
+    # A single flat list of jobs, s.t. one pool of workers can process all of the variants
+    jobs: List[Job] = [
+        (variant, language, dataset, location, str(out_dir))
+        for variant, (language, dataset, location) in itertools.product(variants, inputs)
+    ]
+    if not force:
+        # Documents generated by a previous (e.g. interrupted) run are not regenerated
+        jobs = [job for job in jobs if not _out_path(job).exists()]
+
+    if workers > 1:
+        # The context manager shuts the workers down also when the loop is interrupted, e.g. by an error or Ctrl-C
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as executor:
+            _report_results(executor.map(_run_one, jobs, chunksize=4), len(jobs), verbose)
+    else:
+        _report_results(map(_run_one, jobs), len(jobs), verbose)
 
 
 if __name__ == "__main__":
@@ -73,5 +136,13 @@ if __name__ == "__main__":
     parser.add_argument("-l", "--languages", nargs="*", help="Identifiers of languages to generate", required=False)
     parser.add_argument("-v", "--variants", nargs="*", help="What document planner variants to use", required=False)
     parser.add_argument("--verbose", action="store_true", default=False, help="Print progress reports")
+    parser.add_argument(
+        "-w", "--workers", type=int, help="Number of worker processes (default: number of CPUs)", required=False
+    )
+    parser.add_argument(
+        "--force", action="store_true", default=False, help="Regenerate documents whose output file already exists"
+    )
     args = parser.parse_args()
-    generate(args.out, args.datasets, args.languages, args.locations, args.variants, args.verbose)
+    generate(
+        args.out, args.datasets, args.languages, args.locations, args.variants, args.verbose, args.workers, args.force
+    )
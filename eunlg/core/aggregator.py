@@ -1,6 +1,5 @@
 import logging
-from collections import defaultdict
-from typing import List, Tuple
+from typing import Any, Dict, List, Optional, Tuple
 
 from numpy.random import Generator
 
@@ -10,8 +9,22 @@ from core.registry import Registry
 
 log = logging.getLogger(__name__)
 
+# Marker for nodes whose prefix key could not be determined
+_NO_PREFIX_KEY = object()
+
+# Used when the registry contains no conjunctions for the language
+_MISSING_CONJUNCTIONS = {
+    "default_combiner": "MISSING-DEFAULT-CONJUCTION",
+    "inverse_combiner": "MISSING-INVERSE-CONJUCTION",
+}
+
 
 class Aggregator(NLGPipelineComponent):
+    def __init__(self) -> None:
+        # Comparison keys of template components, keyed by the id of the template. The template is stored alongside
+        # the keys, s.t. it can't be garbage collected and its id reused during the run.
+        self._comparison_keys: Dict[int, Tuple[Template, List[Optional[Tuple]]]] = {}
+
     def run(
         self, registry: Registry, random: Generator, language: str, document_plan: DocumentPlanNode
     ) -> Tuple[DocumentPlanNode]:
@@ -19,7 +32,10 @@ class Aggregator(NLGPipelineComponent):
             document_plan.print_tree()
 
         log.debug("Aggregating")
-        self._aggregate(registry, language, document_plan)
+        try:
+            self._aggregate(registry, language, document_plan)
+        finally:
+            self._comparison_keys = {}
 
         if log.isEnabledFor(logging.DEBUG):
             document_plan.print_tree()
@@ -27,7 +43,7 @@ class Aggregator(NLGPipelineComponent):
         return (document_plan,)
 
     def _aggregate(self, registry: Registry, language: str, document_plan_node: DocumentPlanNode) -> DocumentPlanNode:
-        log.debug("Visiting {}".format(document_plan_node))
+        log.debug("Visiting %s", document_plan_node)
 
         # Cannot aggregate a single Message
         if isinstance(document_plan_node, Message):
@@ -42,36 +58,48 @@ class Aggregator(NLGPipelineComponent):
     def _aggregate_sequence(
         self, registry: Registry, language: str, document_plan_node: DocumentPlanNode
     ) -> DocumentPlanNode:
-        log.debug("Visiting {}".format(document_plan_node))
+        log.debug("Visiting %s", document_plan_node)
 
-        num_children = len(document_plan_node.children)
         new_children = []  # type: List[Message]
 
-        for idx in range(0, num_children):
-            if idx > 0:
-                previous_child = new_children[-1]
-            else:
-                previous_child = None
-            current_child = document_plan_node.children[idx]
+        # Two messages can only share a combinable prefix if their first components have the same value. Computing
+        # these once lets us reject most pairs without going through _same_prefix.
+        prefix_keys = [self._prefix_key(child) for child in document_plan_node.children]
+        previous_key = _NO_PREFIX_KEY
+
+        for current_child, current_key in zip(document_plan_node.children, prefix_keys):
+            # Every iteration adds to or replaces the last element of new_children, so it's empty only on the first one
+            previous_child = new_children[-1] if new_children else None
 
             if not isinstance(current_child, Message):
                 log.debug("This is not a message, we need to go deeper")
                 new_children.append(self._aggregate(registry, language, current_child))
+                previous_key = _NO_PREFIX_KEY
                 continue
 
             # TODO: ^ I have no clue what the above logic is doing, but it seems to work so not gonna touch it.
             # TODO: current_child should be a Message but seems to be a DocumentPlanNode instead ¯\_(ツ)_/¯
 
             log.debug("Inspecting potential aggregation:")
-            log.debug("\t{}".format(previous_child))
-            log.debug("\t{}".format(current_child))
+            log.debug("\t%s", previous_child)
+            log.debug("\t%s", current_child)
 
             if previous_child is None:
                 log.debug("Can't aggregate first child, as there's nothing to aggregate with")
                 new_children.append(current_child)
+                previous_key = current_key
             elif previous_child.prevent_aggregation or current_child.prevent_aggregation:
                 log.debug("Aggregation prevented, most likely previous child is a result of a previous aggregation.")
                 new_children.append(current_child)
+                previous_key = current_key
+            elif (
+                previous_key is not _NO_PREFIX_KEY
+                and current_key is not _NO_PREFIX_KEY
+                and previous_key != current_key
+            ):
+                log.debug("First components differ, can't aggregate")
+                new_children.append(current_child)
+                previous_key = current_key
             elif self._same_prefix(previous_child, current_child):
                 log.debug("Aggregation allowed, shared prefix")
                 # Some slots might have an implicit time value, by virtue of not having a {time} slot.
@@ -86,16 +114,19 @@ class Aggregator(NLGPipelineComponent):
                     # Case #2
                     log.debug("Swapping the location of two fragments for better time realization")
                     new_children[-1] = self._combine(registry, language, current_child, new_children[-1])
+                    previous_key = current_key
                 elif self._has_implicit_time(previous_child) and not self._has_implicit_time(current_child):
                     # Case #5
                     log.debug("Incompatible time expressions, can't combine")
                     new_children.append(current_child)
+                    previous_key = current_key
                 else:
                     # Cases #1, #3 and #4
                     new_children[-1] = self._combine(registry, language, new_children[-1], current_child)
             else:
                 log.debug("No shared prefix, can't aggregate")
                 new_children.append(current_child)
+                previous_key = current_key
 
         document_plan_node.children.clear()
         document_plan_node.children.extend(new_children)
@@ -112,16 +143,24 @@ class Aggregator(NLGPipelineComponent):
         raise NotImplementedError
 
     def _get_combinable_prefix(self, first: Message, second: Message):
-        try:
-            getattr(first.template, "components")
-            getattr(second.template, "components")
-        except AttributeError:
+        first_template = getattr(first, "template", None)
+        second_template = getattr(second, "template", None)
+        if getattr(first_template, "components", None) is None or getattr(second_template, "components", None) is None:
             return []
 
         shared_prefix = []
 
-        for m1_component, m2_component in zip(first.template.components, second.template.components):
-            if self._are_same(m1_component, m2_component):
+        for m1_component, m2_component, m1_key, m2_key in zip(
+            first.template.components,
+            second.template.components,
+            self._template_comparison_keys(first.template),
+            self._template_comparison_keys(second.template),
+        ):
+            if m1_key is not None and m2_key is not None and m1_key[0] == m2_key[0] and m1_key[1] == m2_key[1]:
+                same = m1_key == m2_key
+            else:
+                same = self._are_same(m1_component, m2_component)
+            if same:
                 shared_prefix.append(m1_component)
             else:
                 break
@@ -135,7 +174,7 @@ class Aggregator(NLGPipelineComponent):
         # TODO: Check above.
         m1_following = first.template.components[len(shared_prefix)]
         m2_following = second.template.components[len(shared_prefix)]
-        print(f"NEXT COMPONENTS: {m1_following} and {m2_following}")
+        log.debug("Next components: %s and %s", m1_following, m2_following)
         if isinstance(m1_following, Slot) and isinstance(m2_following, Slot):
             if m1_following.slot_type == "result_value" and m2_following.slot_type == "result_value":
                 return shared_prefix
@@ -146,6 +185,14 @@ class Aggregator(NLGPipelineComponent):
             shared_prefix = shared_prefix[:-1]
         return shared_prefix
 
+    def _prefix_key(self, node: DocumentPlanNode) -> Any:
+        if not isinstance(node, Message) or node.template is None or not node.template.components:
+            return _NO_PREFIX_KEY
+        try:
+            return node.template.components[0].value
+        except AttributeError:
+            return _NO_PREFIX_KEY
+
     def _same_prefix(self, first: Message, second: Message) -> bool:
         if first is None or second is None:
             return False
@@ -155,34 +202,68 @@ class Aggregator(NLGPipelineComponent):
         return not message.template.has_slot_of_type("time")
 
     def _combine(self, registry: Registry, language: str, first: Message, second: Message) -> Message:
-        log.debug("Combining two templates:")
-        log.debug("\t{}".format([c.value for c in first.template.components]))
-        log.debug("\t{}".format([c.value for c in second.template.components]))
+        debug = log.isEnabledFor(logging.DEBUG)
+        if debug:
+            log.debug("Combining two templates:")
+            log.debug("\t%s", [c.value for c in first.template.components])
+            log.debug("\t%s", [c.value for c in second.template.components])
 
         shared_prefix = self._get_combinable_prefix(first, second)
-        log.debug(f"Shared prefix is {[e.value for e in shared_prefix]}")
-        combined = [c for c in first.template.components]
+        if debug:
+            log.debug("Shared prefix is %s", [e.value for e in shared_prefix])
 
         # TODO At the moment everything is considered either positive or negative, which is sometimes weird.
         #  Add neutral sentences.
-        conjunctions = registry.get("conjunctions").get(language, None)
-        if not conjunctions:
-            conjunctions = (defaultdict(lambda x: "NO-CONJUNCTION-DICT"),)
+        conjunctions = registry.get("conjunctions").get(language, None) or _MISSING_CONJUNCTIONS
 
-        if first.polarity != first.polarity:
-            combined.append(Literal(conjunctions.get("inverse_combiner", "MISSING-INVERSE-CONJUCTION")))
+        if first.polarity != second.polarity:
+            conjunction = Literal(conjunctions.get("inverse_combiner", "MISSING-INVERSE-CONJUCTION"))
         else:
-            combined.append(Literal(conjunctions.get("default_combiner", "MISSING-DEFAULT-CONJUCTION")))
-        combined.extend(second.template.components[len(shared_prefix) :])
-        log.debug("Combined thing is {}".format([c.value for c in combined]))
+            conjunction = Literal(conjunctions.get("default_combiner", "MISSING-DEFAULT-CONJUCTION"))
+        # Built in one go, rather than by growing a copy of the first template's components
+        combined = [*first.template.components, conjunction, *second.template.components[len(shared_prefix) :]]
+        if debug:
+            log.debug("Combined thing is %s", [c.value for c in combined])
+        first_facts = set(first.facts)
         new_message = Message(
-            facts=first.facts + [fact for fact in second.facts if fact not in first.facts],
+            facts=first.facts + [fact for fact in second.facts if fact not in first_facts],
             importance_coefficient=first.importance_coefficient,
         )
         new_message.template = Template(combined)
         new_message.prevent_aggregation = True
         return new_message
 
+    def _template_comparison_keys(self, template: Template) -> List[Optional[Tuple]]:
+        cached = self._comparison_keys.get(id(template))
+        if cached is None:
+            cached = (template, [self._comparison_key(c) for c in template.components])
+            self._comparison_keys[id(template)] = cached
+        return cached[1]
+
+    def _comparison_key(self, component: TemplateComponent) -> Optional[Tuple]:
+        """
+        Flattens the information checked by _are_same into a tuple. Two components whose keys have the same kind and
+        slot_type (the first two items) are the same iff their keys are equal. Returns None for components that can't
+        be represented this way (e.g. slots without a Fact, value slots or NaN values), in which case, as well as when
+        the kinds or slot_types differ, the components need to be compared with _are_same.
+        """
+        try:
+            value = component.value
+            if value != value:
+                # NaN is not equal to itself, but would be in a tuple comparison
+                return None
+            if not isinstance(component, Slot):
+                return ("literal", None, value)
+            if not isinstance(component.fact, Fact) or component.slot_type == "value":
+                return None
+            slot_type = component.slot_type
+            fact_value = getattr(component.fact, slot_type) if slot_type in Fact._fields else None
+            if fact_value != fact_value:
+                return None
+            return ("slot", slot_type, value, fact_value, component.attributes.get("case", ""))
+        except AttributeError:
+            return None
+
     def _are_same(self, c1: TemplateComponent, c2: TemplateComponent) -> bool:
         if c1.value != c2.value:
             # Are completely different, are not same
@@ -1,15 +1,23 @@
-import gzip
 import logging
-import pickle
+import os
 import re
+import tempfile
 from abc import ABC
-from typing import Callable, List, Optional, Union
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional, Tuple, Union
 
-from pandas import DataFrame
+from pandas import DataFrame, read_pickle
 from pandas import HDFStore as PandasHDFStore
+from pyarrow import feather
 
 log = logging.getLogger(__name__)
 
+# Loaded DataFrames, keyed by path, s.t. constructing several stores for the same file only loads it once per process
+_DATAFRAME_CACHE: Dict[str, DataFrame] = {}
+
+# Files starting with these bytes are stores saved in the legacy gzip+pickle format
+GZIP_MAGIC = b"\x1f\x8b"
+
 
 class DataStore(ABC):
     def query(self, query: str) -> DataFrame:
@@ -17,14 +25,21 @@ class DataStore(ABC):
 
 
 class DataFrameStore(DataStore):
+    """
+    A DataStore backed by a zstd-compressed Feather file. Stores in the legacy gzip+pickle format are converted to
+    Feather the first time they are read.
+    """
+
+    compression = "zstd"
+
     def __init__(self, path: str, compute: Optional[Callable] = None) -> None:
         self.path = path
         if compute:
             log.info("Computing contents for DataFrame at {}".format(path))
             self.save(compute())
-        with gzip.open(self.path, "rb") as f:
-            log.debug("Loading DataFrame from {}".format(path))
-            self.dataframe = pickle.load(f)
+        if self.path not in _DATAFRAME_CACHE:
+            _DATAFRAME_CACHE[self.path] = self._load()
+        self.dataframe = _DATAFRAME_CACHE[self.path]
 
     def query(self, query: str) -> DataFrame:
         log.debug('Running query "{}" against DataFrame at {}'.format(query, self.path))
@@ -35,16 +50,47 @@ class DataFrameStore(DataStore):
 
     def save(self, dataframe: DataFrame) -> None:
         log.debug("Storing DataFrame at {}".format(self.path))
-        with gzip.open(self.path, "wb") as f:
-            pickle.dump(dataframe, f)
+        # Write to a temporary file first, s.t. a failed write can't destroy an existing store. The file is unique to
+        # this call, s.t. several processes converting the same store at the same time don't write into the same file.
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(self.path), suffix=".tmp")
+        os.close(fd)
+        try:
+            feather.write_feather(dataframe, tmp_path, compression=self.compression)
+            os.replace(tmp_path, self.path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        _DATAFRAME_CACHE.pop(self.path, None)
+
+    def _load(self) -> DataFrame:
+        with open(self.path, "rb") as f:
+            is_legacy = f.read(len(GZIP_MAGIC)) == GZIP_MAGIC
+
+        if not is_legacy:
+            log.debug("Loading DataFrame from {}".format(self.path))
+            return feather.read_feather(self.path, memory_map=True)
+
+        log.info("Found legacy gzip+pickle DataFrame at {}, converting to Feather".format(self.path))
+        dataframe = read_pickle(self.path, compression="gzip")
+        try:
+            self.save(dataframe)
+        except Exception as ex:
+            # Feather can't store everything a pickle can (e.g. non-default indices). Keep the legacy file as-is.
+            log.warning("Unable to convert DataFrame at {} to Feather, keeping legacy format: {}".format(self.path, ex))
+        return dataframe
 
 
 class HdfStore(DataStore):
     complevel = 9
     complib = "blosc:zstd"
+    query_cache_size = 1024
+    where_re = re.compile(r"where([^_])")
 
     def __init__(self, path: str, table: str, compute: Optional[Callable] = None) -> None:
         self.table = table
+        # The same queries are repeated for every pipeline run, so cache the results of the (slow) PyTables selects.
+        # The cache is per-instance, s.t. it's discarded along with the store.
+        self._cached_select = lru_cache(maxsize=self.query_cache_size)(self._select)
         if compute:
             self.store = PandasHDFStore(path, complevel=self.complevel, complib=self.complib)
             dataframe = compute()
@@ -61,9 +107,15 @@ class HdfStore(DataStore):
         else:
             self.store = PandasHDFStore(path, complevel=self.complevel, complib=self.complib, mode="r")
 
-    def query(self, query: str) -> DataFrame:
+    def query(self, query: Union[str, List[str]]) -> DataFrame:
         query = self._mangle_where_in_query(query)
-        df = self.store.select(self.table, where=query)
+        # Lists aren't hashable, so they need to be converted for the cache lookup
+        cache_key = query if isinstance(query, str) else tuple(query)
+        # Return a copy, s.t. callers modifying the result can't corrupt the cached DataFrame
+        return self._cached_select(cache_key).copy()
+
+    def _select(self, query: Union[str, Tuple[str, ...]]) -> DataFrame:
+        df = self.store.select(self.table, where=query if isinstance(query, str) else list(query))
         self._unmangle_where(df)
         return df
 
@@ -78,6 +130,6 @@ class HdfStore(DataStore):
     def _mangle_where_in_query(self, query: Union[str, List[str]]) -> Union[str, List[str]]:
         # See: https://github.com/PyTables/PyTables/issues/638
         if isinstance(query, str):
-            return re.sub("where([^_])", "where_\\1", query)
+            return self.where_re.sub(r"where_\1", query)
         else:
-            return [self._mangle_where_in_query(subquery) for subquery in query]
+            return [self.where_re.sub(r"where_\1", subquery) for subquery in query]
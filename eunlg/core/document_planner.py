@@ -1,6 +1,6 @@
 import logging
 from abc import abstractmethod
-from typing import List, Tuple
+from typing import Dict, List, Tuple
 
 from numpy.random import Generator
 
@@ -70,13 +70,14 @@ class BodyDocumentPlanner(DocumentPlanner):
         # Root contains a sequence of children
         document_plan = DocumentPlanNode(children=[], relation=Relation.SEQUENCE)
 
-        # Make copies of arguments s.t. we can modify in place
-        available_core_messages = core_messages[:]
-        available_expanded_messages = expanded_messages[:]
+        # Make copies of arguments s.t. we can modify in place. The messages are keyed by their identity, as that's
+        # what they are compared by, and insertion order is retained so the selection order doesn't change.
+        available_core_messages: Dict[int, Message] = {id(m): m for m in core_messages}
+        available_expanded_messages: Dict[int, Message] = {id(m): m for m in expanded_messages}
         selected_nuclei: List[Message] = []
 
         while True:
-            nucleus, nucleus_score = self.select_next_nucleus(available_core_messages, selected_nuclei)
+            nucleus, nucleus_score = self.select_next_nucleus(list(available_core_messages.values()), selected_nuclei)
             if (
                 nucleus is None
                 or nucleus_score < self.new_paragraph_absolute_threshold
@@ -90,16 +91,17 @@ class BodyDocumentPlanner(DocumentPlanner):
             selected_nuclei.append(nucleus)
 
             # Messages are only allowed in the DP once
-            available_core_messages = [m for m in available_core_messages if m != nucleus]
+            available_core_messages.pop(id(nucleus), None)
 
             # Get a suitable amount of satellites
             satellites: List[Message] = self.select_satellites_for_nucleus(
-                nucleus, available_core_messages, available_expanded_messages
+                nucleus, list(available_core_messages.values()), list(available_expanded_messages.values())
             )
 
             # Messages are only allowed in the DP once
-            available_core_messages = [m for m in available_core_messages if m not in satellites]
-            available_expanded_messages = [m for m in available_expanded_messages if m not in satellites]
+            for satellite in satellites:
+                available_core_messages.pop(id(satellite), None)
+                available_expanded_messages.pop(id(satellite), None)
 
             document_plan.children.append(DocumentPlanNode([nucleus] + satellites, Relation.SEQUENCE))
 
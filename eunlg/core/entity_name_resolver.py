@@ -1,7 +1,7 @@
 import logging
+import sys
 from abc import abstractmethod
-from collections import defaultdict
-from typing import Any, DefaultDict, Set, Tuple
+from typing import Any, Dict, List, Set, Tuple
 
 from numpy.random import Generator
 
@@ -35,64 +35,71 @@ class EntityNameResolver(NLGPipelineComponent):
             language = language[:-5]
             log.debug("Language had suffix '-head', removing. Result: {}".format(language))
 
-        previous_entities = defaultdict(lambda: None)
-        self._recurse(registry, random, language, document_plan, previous_entities, set())
+        self._resolve_entities(registry, random, language, document_plan)
 
         if log.isEnabledFor(logging.DEBUG):
             document_plan.print_tree()
 
         return (document_plan,)
 
-    def _recurse(
+    def _resolve_entities(
+        self, registry: Registry, random: Generator, language: str, document_plan: DocumentPlanNode
+    ) -> None:
+        """
+        Traverses the DocumentPlan tree in-order and modifies named entity to_value functions to return the chosen
+        form of that NE's name.
+        """
+        previous_entities: Dict[str, str] = {}
+        encountered: Set[str] = set()
+
+        # Explicit stack instead of recursion. Children are pushed in reverse s.t. they are popped in order.
+        stack: List[Any] = [document_plan]
+        while stack:
+            this = stack.pop()
+            if isinstance(this, Slot):
+                self._resolve_slot(registry, random, language, this, previous_entities, encountered)
+            elif isinstance(this, DocumentPlanNode):
+                log.debug("Visiting non-leaf '%s'", this)
+                stack.extend(reversed(this.children))
+
+    def _resolve_slot(
         self,
         registry: Registry,
         random: Generator,
         language: str,
-        this: DocumentPlanNode,
-        previous_entities: DefaultDict[str, None],
+        this: Slot,
+        previous_entities: Dict[str, str],
         encountered: Set[str],
-    ) -> Tuple[Set[str], DefaultDict[str, None]]:
-        """
-        Traverses the DocumentPlan tree recursively in-order and modifies named
-        entity to_value functions to return the chosen form of that NE's name.
-        """
-        if isinstance(this, Slot):
-            if not self.is_entity(this.value):
-                log.debug("Visited non-NE leaf node {}".format(this.value))
-                return encountered, previous_entities
-
-            log.debug("Visiting NE leaf {}".format(this.value))
-            entity_type, entity = self.parse_entity(this.value)
-
-            if previous_entities[entity_type] == entity:
-                log.debug("Same as previous entity")
-                this.attributes["name_type"] = "pronoun"
-
-            elif entity in encountered:
-                log.debug("Different entity than previous, but has been previously encountered")
-                this.attributes["name_type"] = "short"
-
-            else:
-                log.debug("First time encountering this entity")
-                this.attributes["name_type"] = "full"
-                encountered.add(entity)
-                log.debug("Added entity to encountered, all encountered: {}".format(encountered))
-
-            self.resolve_surface_form(registry, random, language, this, entity, entity_type)
-            log.debug("Resolved entity name")
-
-            this.attributes["entity_type"] = entity_type
-            previous_entities[entity_type] = entity
-
-            return encountered, previous_entities
-        elif isinstance(this, DocumentPlanNode):
-            log.debug("Visiting non-leaf '{}'".format(this))
-            for child in this.children:
-                encountered, previous_entities = self._recurse(
-                    registry, random, language, child, previous_entities, encountered
-                )
-            return encountered, previous_entities
-        return encountered, previous_entities
+    ) -> None:
+        if not self.is_entity(this.value):
+            log.debug("Visited non-NE leaf node %s", this.value)
+            return
+
+        log.debug("Visiting NE leaf %s", this.value)
+        entity_type, entity = self.parse_entity(this.value)
+        # The same few entities recur throughout the document, interning makes the comparisons below mostly identity
+        # checks. The name_type values assigned below are literals, and thus already interned.
+        entity_type, entity = sys.intern(entity_type), sys.intern(entity)
+
+        if previous_entities.get(entity_type) == entity:
+            log.debug("Same as previous entity")
+            this.attributes["name_type"] = "pronoun"
+
+        elif entity in encountered:
+            log.debug("Different entity than previous, but has been previously encountered")
+            this.attributes["name_type"] = "short"
+
+        else:
+            log.debug("First time encountering this entity")
+            this.attributes["name_type"] = "full"
+            encountered.add(entity)
+            log.debug("Added entity to encountered, all encountered: %s", encountered)
+
+        self.resolve_surface_form(registry, random, language, this, entity, entity_type)
+        log.debug("Resolved entity name")
+
+        this.attributes["entity_type"] = entity_type
+        previous_entities[entity_type] = entity
 
     @abstractmethod
     def is_entity(self, maybe_entity: Any) -> bool:
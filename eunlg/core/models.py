@@ -3,7 +3,7 @@ import operator
 import re
 from abc import ABC, abstractmethod
 from enum import Enum
-from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple, Union
+from typing import Any, Callable, Dict, FrozenSet, Iterator, List, NamedTuple, Optional, Tuple, Union
 
 log = logging.getLogger(__name__)
 
@@ -13,15 +13,18 @@ class Document(object):
         self.language = language
         self.document_plan = document_plan
 
-    def messages(self):
-        return self._recursively_find_messages(self.document_plan)
+    def messages(self) -> Iterator["Message"]:
+        return self._find_messages(self.document_plan)
 
-    def _recursively_find_messages(self, root: "DocumentPlanNode") -> List["Message"]:
-        if isinstance(root, Message):
-            yield root
-        else:
-            for child in root.children:
-                yield from self._recursively_find_messages(child)
+    def _find_messages(self, root: "DocumentPlanNode") -> Iterator["Message"]:
+        # Explicit stack instead of recursion. Children are pushed in reverse s.t. they are popped in order.
+        stack = [root]
+        while stack:
+            node = stack.pop()
+            if isinstance(node, Message):
+                yield node
+            else:
+                stack.extend(reversed(node.children))
 
 
 class Relation(Enum):
@@ -41,6 +44,8 @@ class DocumentPlanNode(object):
     A Node in the document plan. Has an ordered list of children, collectively connected by a Relation.
     """
 
+    __slots__ = ("_children", "_relation")
+
     def __init__(
         self, children: Optional[List["DocumentPlanNode"]] = None, relation: Relation = Relation.SEQUENCE
     ) -> None:
@@ -58,19 +63,31 @@ class DocumentPlanNode(object):
     def __str__(self) -> str:
         return self.relation.name
 
-    def print_tree(self, indent: str = "", last: str = "updown") -> None:
+    def _count_descendants(self) -> Dict[int, int]:
+        """
+        Counts the descendants of each node in the tree, keyed by node id. Messages and Templates count as leaves.
+        """
+        counts = {}  # type: Dict[int, int]
+        # Iterative post-order: a node is revisited, and counted, once all of its children have been counted
+        stack = [(self, False)]  # type: List[Tuple[DocumentPlanNode, bool]]
+        while stack:
+            node, children_counted = stack.pop()
+            if isinstance(node, Message) or isinstance(node, Template):
+                counts[id(node)] = 0
+            elif children_counted:
+                counts[id(node)] = sum(1 + counts[id(child)] for child in node.children)
+            else:
+                stack.append((node, True))
+                stack.extend((child, False) for child in node.children)
+        return counts
+
+    def print_tree(self, indent: str = "", last: str = "updown", _counts: Optional[Dict[int, int]] = None) -> None:
         """
         Prints the DocumentPlanNode as a tree.
         Modified from http://stackoverflow.com/a/30893896
         """
-
-        def rec_count(node: DocumentPlanNode) -> int:
-            count = 0
-            if isinstance(node, Message) or isinstance(node, Template):
-                return count
-            for child in node.children:
-                count += 1 + rec_count(child)
-            return count
+        # Sizes of the subtrees, keyed by node id. Computed once for the whole tree and shared with the recursive calls.
+        counts = self._count_descendants() if _counts is None else _counts
 
         up = []
         down = []
@@ -82,16 +99,16 @@ class DocumentPlanNode(object):
             output = self
 
             # Creation of balanced lists for "up" branch and "down" branch.
-            branch_sizes = {child: rec_count(child) + 1 for child in self.children}
+            branch_sizes = {child: counts[id(child)] + 1 for child in self.children}
             up = list(self.children)
             while up and sum(branch_sizes[node] for node in down) < sum(branch_sizes[node] for node in up):
                 down.insert(0, up.pop())
 
             # Printing of "up" branch.
-            for child in up:
-                next_last = "up" if up.index(child) == 0 else ""
+            for idx, child in enumerate(up):
+                next_last = "up" if idx == 0 else ""
                 next_indent = "{0}{1}{2}".format(indent, " " if "up" in last else "│", " " * len(str(self)))
-                child.print_tree(indent=next_indent, last=next_last)
+                child.print_tree(indent=next_indent, last=next_last, _counts=counts)
 
         # Printing of current node.
         if last == "up":
@@ -114,10 +131,10 @@ class DocumentPlanNode(object):
 
         if not isinstance(self, Message):
             # Printing of "down" branch.
-            for child in down:
-                next_last = "down" if down.index(child) == len(down) - 1 else ""
+            for idx, child in enumerate(down):
+                next_last = "down" if idx == len(down) - 1 else ""
                 next_indent = "{0}{1}{2}".format(indent, " " if "down" in last else "│", " " * len(str(self)))
-                child.print_tree(indent=next_indent, last=next_last)
+                child.print_tree(indent=next_indent, last=next_last, _counts=counts)
 
 
 class Message(DocumentPlanNode):
@@ -178,13 +195,9 @@ class Message(DocumentPlanNode):
     @template.setter
     def template(self, template: "Template") -> None:
         self._template = template
-
-    @property
-    def children(self) -> List["TemplateComponent"]:
-        if self.template:
-            return self.template.components
-        else:
-            return []
+        # The children of a Message are the components of its Template. The list is shared rather than copied, s.t.
+        # edits to the components are visible through the children and vice versa.
+        self._children = template.components if template is not None else []
 
     def __repr__(self) -> str:
         if self.template:
@@ -211,16 +224,22 @@ class Fact(NamedTuple):
     outlierness: float
 
 
+# Positions of the Fact fields. Indexing the tuple directly is cheaper than going through the NamedTuple's properties.
+FACT_FIELD_INDICES = {field_name: idx for idx, field_name in enumerate(Fact._fields)}  # type: Dict[str, int]
+
+
 class Template(DocumentPlanNode):
     """
     A template consisting of TemplateComponent elements and a list of rules about the facts that can be presented
     using the template.
     """
 
+    __slots__ = ("_rules", "_facts", "_slot_map", "_components", "_slots", "_slot_types", "rules_str")
+
     def __init__(
         self,
         components: List["TemplateComponent"],
-        rules: Optional[List[Tuple[List["Matcher"], List[int]]]] = None,
+        rules: Optional[List[Tuple[List["Matcher"], Tuple[int, ...]]]] = None,
         rules_str: Optional[str] = None,
         slot_map: Optional[Dict[str, "Slot"]] = None,
     ) -> None:
@@ -234,6 +253,8 @@ class Template(DocumentPlanNode):
         for c in self._components:
             c.parent = self
         self._slots = None
+        # Cached set of slot types, along with the number of components it was computed from
+        self._slot_types = None  # type: Optional[Tuple[int, FrozenSet[str]]]
         self.rules_str = rules_str
 
     def get_slot(self, slot_type: str) -> "Slot":
@@ -244,13 +265,31 @@ class Template(DocumentPlanNode):
         :param slot_type:
         :return:
         """
-        if slot_type not in self._slot_map.keys():
-            slot_of_correct_type = next((slot for slot in self.slots if slot.slot_type == slot_type), None)
-            self._slot_map[slot_type] = slot_of_correct_type
+        if slot_type not in self._slot_map:
+            self._slot_map[slot_type] = next(
+                (c for c in self._components if isinstance(c, Slot) and c.slot_type == slot_type), None
+            )
         if self._slot_map[slot_type] is None:
             raise KeyError('No slot of type "{}" in Template {}'.format(slot_type, self))
         return self._slot_map[slot_type]
 
+    def primary_value_type_prefix(self) -> str:
+        """
+        A string that the value_type of every primary message matching the first rule starts with. Empty if the first
+        rule doesn't restrict the value_type to any literal prefix.
+        """
+        for matcher in self._rules[0][0] if self._rules else []:
+            if (
+                type(matcher.lhs) is FactField
+                and matcher.lhs.field_name == "value_type"
+                and matcher.op == "="
+                and type(matcher.value) is str
+            ):
+                prefix = literal_prefix(matcher.value)
+                if prefix:
+                    return prefix
+        return ""
+
     def add_slot(self, idx: int, slot: "Slot") -> None:
         if len(self._components) > idx:
             self._components.insert(idx, slot)
@@ -258,6 +297,7 @@ class Template(DocumentPlanNode):
             self._components.append(slot)
         slot.parent = self
         self.slots.append(slot)
+        self._slot_types = None
 
     def move_slot(self, from_idx: int, to_idx: int) -> None:
         self.components.insert(to_idx, self.components.pop(from_idx))
@@ -292,7 +332,7 @@ class Template(DocumentPlanNode):
         used_facts = []
 
         # The first rule has to match the primary message
-        if not all(matcher(primary_fact, used_facts) for matcher in self._rules[0][0]):
+        if not all(matcher.matches(primary_fact, used_facts) for matcher in self._rules[0][0]):
             return []
 
         if fill_slots:
@@ -305,18 +345,22 @@ class Template(DocumentPlanNode):
 
         # Check the other rules
         if len(self._rules) > 1:
+            # Looked up once, rather than once per rule. The set mirrors used_facts for fast membership checks.
+            candidate_facts = [mess.main_fact for mess in all_messages]
+            used_facts_set = {primary_fact}
             for (matchers, slot_indices) in self._rules[1:]:
                 # Try each message in turn
-                for mess in all_messages:
-                    if all(matcher(mess.main_fact, used_facts) for matcher in matchers):
+                for fact in candidate_facts:
+                    if all(matcher.matches(fact, used_facts) for matcher in matchers):
                         # Found a suitable message: fill the slots
                         if fill_slots:
                             for slot_index in slot_indices:
                                 component = self._components[slot_index]
                                 if isinstance(component, Slot):
-                                    component.fact = mess.main_fact
-                        if mess.main_fact not in used_facts:
-                            used_facts.append(mess.main_fact)
+                                    component.fact = fact
+                        if fact not in used_facts_set:
+                            used_facts.append(fact)
+                            used_facts_set.add(fact)
                         # Move onto the next rule
                         break
                 else:
@@ -349,7 +393,13 @@ class Template(DocumentPlanNode):
         return self._slots
 
     def has_slot_of_type(self, slot_type: str) -> bool:
-        return any(isinstance(c, Slot) and c.slot_type == slot_type for c in self._components)
+        # The components can be edited in place (e.g. by slot realizers replacing a slot with several copies of it),
+        # so the cached set is only reused while the number of components stays the same. Replacement slots keep the
+        # slot_type of the slot they replace, so the set itself stays valid when a slot is replaced one-for-one.
+        if self._slot_types is None or self._slot_types[0] != len(self._components):
+            slot_types = frozenset(c.slot_type for c in self._components if isinstance(c, Slot))
+            self._slot_types = (len(self._components), slot_types)
+        return slot_type in self._slot_types[1]
 
     def copy(self) -> "Template":
         """Makes a deep copy of this Template. The copy does not contain any messages."""
@@ -368,6 +418,8 @@ class Template(DocumentPlanNode):
 
 
 class DefaultTemplate(Template):
+    __slots__ = ()
+
     def __init__(self, canned_text: str) -> None:
         super().__init__(components=[Literal(canned_text)])
 
@@ -375,6 +427,8 @@ class DefaultTemplate(Template):
 class TemplateComponent(object):
     """An abstract TemplateComponent. Should not be used directly."""
 
+    __slots__ = ("_parent",)
+
     def __init__(self) -> None:
         self._parent = None
 
@@ -401,12 +455,18 @@ class TemplateComponent(object):
         return "[AbstractTemplateComponent]"
 
 
+# Marker for Slots whose value has not been computed since the fact or the value source last changed
+_NOT_COMPUTED = object()
+
+
 class Slot(TemplateComponent):
     """
     A TemplateComponent that can be filled by a Fact that fulfills a set of
     requirements.
     """
 
+    __slots__ = ("attributes", "_to_value", "_fact", "slot_type", "_value")
+
     # Todo: Are the values in "attributes" of a known type?
     def __init__(
         self,
@@ -426,13 +486,26 @@ class Slot(TemplateComponent):
         self.fact = fact
         self.slot_type = to_value.field_name if slot_type is None else slot_type
 
+    @property
+    def fact(self) -> Optional[Fact]:
+        return self._fact
+
+    @fact.setter
+    def fact(self, fact: Optional[Fact]) -> None:
+        self._fact = fact
+        self._value = _NOT_COMPUTED
+
     @property
     def value(self) -> Union[str, int, float]:
-        return self._to_value(self.fact)
+        # The value only depends on the fact and the value source, setting either of which resets the cached value
+        if self._value is _NOT_COMPUTED:
+            self._value = self._to_value(self._fact)
+        return self._value
 
     @value.setter
     def value(self, f: Callable) -> None:
         self._to_value = f
+        self._value = _NOT_COMPUTED
 
     def copy(self, include_fact=False) -> "Slot":
         # TODO: Is it intended that Fact is not copied over?
@@ -450,6 +523,8 @@ class Slot(TemplateComponent):
 
 
 class LiteralSlot(Slot):
+    __slots__ = ()
+
     def __init__(self, value: str, attributes: Optional[Dict[str, str]] = None) -> None:
         super().__init__(LiteralSource(value), attributes)
 
@@ -457,6 +532,8 @@ class LiteralSlot(Slot):
 class Literal(TemplateComponent):
     """A string literal."""
 
+    __slots__ = ("_string",)
+
     def __init__(self, string: str) -> None:
         super().__init__()
         self._string = string
@@ -490,8 +567,11 @@ class SlotSource(ABC):
 class FactFieldSource(SlotSource):
     def __init__(self, field_name: str) -> None:
         super().__init__(field_name)
+        self._idx = FACT_FIELD_INDICES.get(field_name)
 
     def __call__(self, fact: Fact) -> Union[str, int]:
+        if self._idx is not None and fact.__class__ is Fact:
+            return fact[self._idx]
         return getattr(fact, self.field_name)
 
     def __str__(self) -> str:
@@ -521,6 +601,10 @@ class TimeSource(SlotSource):
         super().__init__("time")
 
     def __call__(self, fact: Fact) -> str:
+        if fact.__class__ is Fact:
+            return "[TIME:{}:{}]".format(
+                fact[FACT_FIELD_INDICES["timestamp_type"]], fact[FACT_FIELD_INDICES["timestamp"]]
+            )
         return "[TIME:{}:{}]".format(getattr(fact, "timestamp_type"), getattr(fact, "timestamp"))
 
     def __str__(self):
@@ -536,6 +620,8 @@ class UnitSource(SlotSource):
         super().__init__("unit")
 
     def __call__(self, fact: Fact) -> str:
+        if fact.__class__ is Fact:
+            return "[UNIT:{}]".format(fact[FACT_FIELD_INDICES["value_type"]])
         return "[UNIT:{}]".format(getattr(fact, "value_type"))
 
     def __str__(self):
@@ -552,6 +638,8 @@ class LhsExpr(object):
     of the constraint.
     """
 
+    __slots__ = ()
+
     def __call__(self, fact: "Fact", all_facts: List["Fact"]) -> None:
         # Required in subclasses
         raise NotImplementedError()
@@ -565,10 +653,15 @@ class LhsExpr(object):
 
 
 class FactField(LhsExpr):
+    __slots__ = ("field_name", "_idx")
+
     def __init__(self, field_name: str) -> None:
         self.field_name = field_name
+        self._idx = FACT_FIELD_INDICES.get(field_name)
 
     def __call__(self, fact: "Fact", all_facts: List["Fact"]) -> str:
+        if self._idx is not None and fact.__class__ is Fact:
+            return fact[self._idx]
         return getattr(fact, self.field_name)
 
     def __str__(self) -> str:
@@ -577,6 +670,8 @@ class FactField(LhsExpr):
 
 class ReferentialExpr(object):
     # TODO: Is this also supposed to be an LhsExrp?
+    __slots__ = ("field_name", "reference_idx")
+
     def __init__(self, reference_idx: int, field_name: str) -> None:
         self.field_name = field_name
         self.reference_idx = reference_idx
@@ -599,6 +694,55 @@ def _not_equal_op(a: Any, b: Any) -> bool:
     return not _equal_op(a, b)
 
 
+_REGEX_SPECIAL_CHARS = frozenset(".^$*+?{}[]|()\\")
+
+
+def literal_prefix(regex: str) -> str:
+    """
+    Returns a string that every full match of `regex` starts with, or an empty string if no such prefix is found.
+
+    Only the literal characters at the very start of the regex are considered. The prefix is discarded entirely if the
+    regex contains an alternation outside of a group, as the prefix would then only apply to the first alternative.
+    """
+    depth = 0
+    idx = 0
+    while idx < len(regex):
+        char = regex[idx]
+        if char == "\\":
+            idx += 1
+        elif char == "[":
+            # Skip the character class. A closing bracket right after the opening one (or its negation) is a literal.
+            idx += 2 if regex.startswith("[^", idx) else 1
+            idx += 1 if regex.startswith("]", idx) else 0
+            while idx < len(regex) and regex[idx] != "]":
+                idx += 2 if regex[idx] == "\\" else 1
+        elif char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+        elif char == "|" and depth == 0:
+            return ""
+        idx += 1
+
+    prefix = []
+    idx = 1 if regex.startswith("^") else 0
+    while idx < len(regex):
+        char = regex[idx]
+        if char == "\\" and idx + 1 < len(regex) and not regex[idx + 1].isalnum():
+            literal = regex[idx + 1]
+            idx += 2
+        elif char not in _REGEX_SPECIAL_CHARS:
+            literal = char
+            idx += 1
+        else:
+            break
+        # A following "*", "?" or "{m,n}" may make the preceding literal optional
+        if idx < len(regex) and regex[idx] in "*?{":
+            break
+        prefix.append(literal)
+    return "".join(prefix)
+
+
 class Matcher(object):
     OPERATORS = {
         "=": _equal_op,
@@ -610,6 +754,8 @@ class Matcher(object):
         "in": lambda a, b: operator.contains(b, a),
     }
 
+    __slots__ = ("value", "op", "lhs", "matches")
+
     def __init__(self, lhs: LhsExpr, op: str, value: Any) -> None:
         if op not in Matcher.OPERATORS:
             raise ValueError(
@@ -618,16 +764,54 @@ class Matcher(object):
         self.value = value
         self.op = op
         self.lhs = lhs
+        # The matcher with all dispatching resolved. Hot loops should call this directly, rather than the Matcher.
+        self.matches = self._compile()  # type: Callable[[Fact, List[Fact]], bool]
+
+    def _compile(self) -> Callable[[Fact, List[Fact]], bool]:
+        """
+        Resolves the comparison operator, the type of the RHS value and the LHS field access once, returning a
+        function that evaluates the matcher with no further dispatching.
+        """
+        op_fn = Matcher.OPERATORS[self.op]
+        lhs = self.lhs
+        value = self.value
+
+        # Constant string values are compared as regular expressions, compile those once rather than on every call
+        if self.op in ("=", "!=") and type(value) is str:
+            pattern = re.compile("^" + value + "$")
+            if self.op == "=":
+                def op_fn(a: Any, b: Any) -> bool:
+                    return pattern.match(str(a)) is not None
+
+            else:
+                def op_fn(a: Any, b: Any) -> bool:
+                    return pattern.match(str(a)) is None
+
+        # The vast majority of LHS expressions are plain fact field accesses, which can be done directly
+        if type(lhs) is FactField and lhs._idx is not None:
+            field_name = lhs.field_name
+            field_idx = lhs._idx
+            if callable(value):
+                return lambda fact, all_facts: op_fn(
+                    fact[field_idx] if fact.__class__ is Fact else getattr(fact, field_name), value(fact, all_facts)
+                )
+            return lambda fact, all_facts: op_fn(
+                fact[field_idx] if fact.__class__ is Fact else getattr(fact, field_name), value
+            )
+
+        # Fields that aren't part of Fact can only be looked up by name
+        if type(lhs) is FactField:
+            field_name = lhs.field_name
+            if callable(value):
+                return lambda fact, all_facts: op_fn(getattr(fact, field_name), value(fact, all_facts))
+            return lambda fact, all_facts: op_fn(getattr(fact, field_name), value)
+
+        if callable(value):
+            return lambda fact, all_facts: op_fn(lhs(fact, all_facts), value(fact, all_facts))
+        return lambda fact, all_facts: op_fn(lhs(fact, all_facts), value)
 
     def __call__(self, fact: Fact, all_facts: List[Fact]):
-        # Process the LHS expression
-        result = self.lhs(fact, all_facts)
-        if callable(self.value):
-            value = self.value(fact, all_facts)
-        else:
-            value = self.value
-        # Perform the relevant comparison operator
-        return Matcher.OPERATORS[self.op](result, value)
+        return self.matches(fact, all_facts)
 
     def __str__(self):
         return "lambda msg, all: {} ({})     {}      {} ({})".format(
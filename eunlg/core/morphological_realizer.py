@@ -4,7 +4,7 @@ from typing import Dict, List, Tuple
 
 from numpy.random import Generator
 
-from .models import DocumentPlanNode, Message, Slot, TemplateComponent
+from .models import DocumentPlanNode, LiteralSource, Message, Slot, TemplateComponent
 from .pipeline import NLGPipelineComponent
 from .registry import Registry
 
@@ -40,25 +40,31 @@ class MorphologicalRealizer(NLGPipelineComponent):
             log.warning("No morphological realizer for language {}".format(language))
             return (document_plan,)
 
-        self._recurse(language, document_plan)
+        self._realize(language, document_plan)
 
         if log.isEnabledFor(logging.DEBUG):
             document_plan.print_tree()
 
         return (document_plan,)
 
-    def _recurse(self, language: str, this: DocumentPlanNode) -> None:
-        log.debug("Visiting '{}'".format(this))
-        if not isinstance(this, Message):
-            for child in this.children:
-                self._recurse(language, child)
-            return
-
-        for idx, template_component in enumerate(this.template.components):
-            if isinstance(template_component, Slot):
-                left_context = this.template.components[:idx]
-                right_context = this.template.components[idx + 1 :]
-                realized_value = self.language_realizers[language].realize(
-                    template_component, left_context, right_context
-                )
-                template_component.value = lambda x, realized_value=realized_value: realized_value
+    def _realize(self, language: str, document_plan: DocumentPlanNode) -> None:
+        realizer = self.language_realizers[language]
+
+        # Explicit stack instead of recursion. Children are pushed in reverse s.t. they are popped in order.
+        stack: List[DocumentPlanNode] = [document_plan]
+        while stack:
+            this = stack.pop()
+            log.debug("Visiting '%s'", this)
+            if not isinstance(this, Message):
+                stack.extend(reversed(this.children))
+                continue
+
+            # The components list is edited in place by earlier pipeline stages, so it's not cached on the Template.
+            # It is stable for the duration of this loop, though.
+            components = this.template.components
+            for idx, template_component in enumerate(components):
+                if isinstance(template_component, Slot):
+                    left_context = components[:idx]
+                    right_context = components[idx + 1 :]
+                    realized_value = realizer.realize(template_component, left_context, right_context)
+                    template_component.value = LiteralSource(realized_value)
@@ -31,6 +31,12 @@ class NLGPipelineComponent(ABC):
 class LanguageSplitComponent(NLGPipelineComponent):
     def __init__(self, subcomponents: Dict[str, NLGPipelineComponent]):
         self.subcomponents = subcomponents
+        # Headline languages are served by the subcomponent of the base language, e.g. "en-head" by "en". The aliases
+        # are resolved here once, rather than stripping the suffix on every run.
+        self._dispatch = {
+            language: component for language, component in subcomponents.items() if not language.endswith("-head")
+        }
+        self._dispatch.update((language + "-head", component) for language, component in subcomponents.items())
 
     def run(self, registry, random, language, *args):
         """
@@ -41,14 +47,15 @@ class LanguageSplitComponent(NLGPipelineComponent):
         See e.g. https://github.com/python/mypy/issues/5876 for discussion.
         """
 
-        lookup_language = language[:-5] if language.endswith("-head") else language
-        if lookup_language not in self.subcomponents:
+        subcomponent = self._dispatch.get(language)
+        if subcomponent is None:
+            lookup_language = language[:-5] if language.endswith("-head") else language
             raise Exception(
                 "Attempted to access subcomponent for unknown language {} (formatted as {})".format(
                     language, lookup_language
                 )
             )
-        return self.subcomponents[lookup_language].run(registry, random, language, *args)
+        return subcomponent.run(registry, random, language, *args)
 
 
 class NLGPipeline(object):
@@ -69,14 +76,15 @@ class NLGPipeline(object):
         log.debug("PRNG seed is {}".format(prng_seed))
         prng: Generator = random.default_rng(prng_seed)
         log.info("First random is {}".format(prng.integers(0, 1000000)))
-        args = initial_inputs
-        for component in self.components:
-            log.info("Running component {}".format(component))
-            try:
-                output = component.run(self.registry, prng, language, *args)
-            except Exception as ex:
-                log.exception(ex)
-                raise
-            args = output
+        registry = self.registry
+        output = initial_inputs
+        # A single handler for the whole run, rather than one per component. The traceback still shows the component.
+        try:
+            for component in self.components:
+                log.info("Running component {}".format(component))
+                output = component.run(registry, prng, language, *output)
+        except Exception as ex:
+            log.exception(ex)
+            raise
         log.info("NLG Pipeline completed")
         return output
@@ -1,11 +1,15 @@
 import logging
+import math
 import re
 from abc import ABC, abstractmethod
+from collections import deque
+from functools import lru_cache
+from string import Formatter
 from typing import Callable, Dict, Iterable, List, Optional, Tuple, Union
 
 from numpy.random import Generator
 
-from .models import DocumentPlanNode, Message, Slot, TemplateComponent
+from .models import DocumentPlanNode, LiteralSource, Message, Slot, TemplateComponent, literal_prefix
 from .pipeline import NLGPipelineComponent
 from .registry import Registry
 
@@ -17,6 +21,8 @@ class SlotRealizer(NLGPipelineComponent):
         self._random = None
         self._registry = None
         self.slot_realizers = None
+        # The slot realizers applicable to each language, built once per registry
+        self._slot_realizers_by_language: Dict[str, Tuple["SlotRealizerComponent", ...]] = {}
 
     def run(
         self, registry: Registry, random: Generator, language: str, document_plan: DocumentPlanNode
@@ -25,50 +31,63 @@ class SlotRealizer(NLGPipelineComponent):
         Run this pipeline component.
         """
         log.info("Realizing slots")
+        if registry is not self._registry:
+            self._slot_realizers_by_language = {}
         self._registry = registry
         self._random = random
-        # This *MUST* be a copy operation. Otherwise we just keep appending more NumberRealizers to it, leaking
-        # memory all over the place and causing a slowdown. Previously, when this was re-initialized per-slot, the
-        # slowdown ended up being about a factor of 500 over the generation of ~120 texts.
-        self.slot_realizers = self._registry.get("slot-realizers")[:]
-        self.slot_realizers.append(NumberRealizer())
-        while self._recurse(document_plan, language.split("-")[0]):
-            pass  # Repeat until no more changes
+        language = language.split("-")[0]
+        self.slot_realizers = self._slot_realizers_by_language.get(language)
+        if self.slot_realizers is None:
+            self.slot_realizers = self._slot_realizers_by_language[language] = self._get_slot_realizers(language)
+        # Explicit stack instead of recursion. Children are pushed in reverse s.t. they are popped in order.
+        stack = [document_plan]
+        while stack:
+            node = stack.pop()
+            if isinstance(node, Message):
+                self._realize_message(language, node)
+            else:
+                log.debug("Visiting '%s'", node)
+                stack.extend(reversed(node.children))
         return (document_plan,)
 
-    def _recurse(self, this: DocumentPlanNode, language: str) -> bool:
-        if not isinstance(this, Message):
-            log.debug("Visiting '{}'".format(this))
-            return any(self._recurse(child, language) for child in this.children)
-        else:
-            log.debug("Visiting {}".format(this))
-            any_modified = False
-            # Use indexes to iterate through the children since the template slots may be edited, added or replaced
-            # during iteration. Ugly, but will do for now.
-            idx = 0
-            while idx < len(this.children):
-                child = this.children[idx]
-                if not isinstance(child, Slot):
-                    idx += 1
-                    continue
-                modified_components = self._realize_slot(language, child)
-                if modified_components != [child]:
-                    any_modified = True
-                this.children[idx : idx + 1] = modified_components
-                idx += len(modified_components)
-            return any_modified
+    def _get_slot_realizers(self, language: str) -> Tuple["SlotRealizerComponent", ...]:
+        # Only the realizers applicable to this language are retained, so that they need not be filtered per slot.
+        # The registered list is not modified: appending the NumberRealizer to it would keep adding more of them,
+        # leaking memory all over the place and causing a slowdown. Previously, when this was re-initialized per-slot,
+        # the slowdown ended up being about a factor of 500 over the generation of ~120 texts.
+        return tuple(
+            slot_realizer
+            for slot_realizer in self._registry.get("slot-realizers")
+            if language in slot_realizer.supported_languages() or "ANY" in slot_realizer.supported_languages()
+        ) + (NumberRealizer(),)
+
+    def _realize_message(self, language: str, message: Message) -> None:
+        log.debug("Visiting %s", message)
+        # Only the slots produced by a realizer can need further realization, so rather than re-visiting every slot
+        # until nothing changes, the slots still waiting for realization are kept in a queue. The children are the
+        # components of the message's template and are thus edited in place.
+        children = message.children
+        pending = deque(child for child in children if isinstance(child, Slot))
+        while pending:
+            slot = pending.popleft()
+            modified_components = self._realize_slot(language, slot)
+            if modified_components == [slot]:
+                continue
+            idx = next(idx for idx, child in enumerate(children) if child is slot)
+            children[idx : idx + 1] = modified_components
+            pending.extend(component for component in modified_components if isinstance(component, Slot))
 
     def _realize_slot(self, language: str, slot: Slot) -> List[TemplateComponent]:
         for slot_realizer in self.slot_realizers:
-            assert isinstance(slot_realizer, SlotRealizerComponent)
-            if language in slot_realizer.supported_languages() or "ANY" in slot_realizer.supported_languages():
-                success, components = slot_realizer.realize(slot, self._random)
-                if success:
-                    return components
+            success, components = slot_realizer.realize(slot, self._random)
+            if success:
+                return components
         return [slot]
 
 
 class SlotRealizerComponent(ABC):
+    __slots__ = ()
+
     @abstractmethod
     def supported_languages(self) -> List[str]:
         pass
@@ -79,6 +98,8 @@ class SlotRealizerComponent(ABC):
 
 
 class NumberRealizer(SlotRealizerComponent):
+    __slots__ = ()
+
     def supported_languages(self) -> List[str]:
         return ["ANY"]
 
@@ -95,18 +116,91 @@ class NumberRealizer(SlotRealizerComponent):
 
         if isinstance(value, (int, float)):
             if int(value) == value:
-                slot.value = lambda x: int(value)
+                slot.value = LiteralSource(int(value))
                 return True, [slot]
 
-            for rounding in range(5):
-                if round(value, rounding) != 0:
-                    slot.value = lambda x: round(value, rounding + 2)
-                    return True, [slot]
+            # Round to two decimals past the first decimal place at which the value no longer rounds to zero, i.e.
+            # the smallest `rounding` for which 2 * abs(value) >= 10 ** -rounding. Values that round to zero even at
+            # four decimal places are left as they are.
+            if round(value, 4) != 0:
+                rounding = max(0, -math.floor(math.log10(2 * abs(value))))
+                slot.value = LiteralSource(round(value, rounding + 2))
+                return True, [slot]
 
         return True, [slot]
 
 
+def _tokenize_template(template: str) -> Optional[List[Union[str, int]]]:
+    """
+    Splits a realization template into its whitespace-separated tokens ahead of time. Literal tokens are kept as
+    strings, while replacement fields that form whole tokens are replaced with the index of the group filling them.
+
+    Returns None if the template can not be tokenized ahead of time, e.g. as a field is glued to other text or uses a
+    conversion or a format spec. Such templates are formatted and split on each realization instead.
+    """
+    tokens: List[Union[str, int]] = []
+    auto_idx = 0
+    has_auto_fields = False
+    has_manual_fields = False
+    # Escaped braces split the literal text into multiple parts, so the literal text is collected up to the next field
+    literal = ""
+    try:
+        parsed_template = list(Formatter().parse(template))
+    except ValueError:
+        # Malformed templates are left for str.format to fail on
+        return None
+    for literal_text, field_name, format_spec, conversion in parsed_template:
+        literal += literal_text
+        if field_name is None:
+            continue
+        if format_spec or conversion:
+            return None
+        # The field must be separated from the text or field preceding it, and that text from any field preceding it
+        if (literal and not literal[-1].isspace()) or (not literal and tokens):
+            return None
+        if literal and tokens and isinstance(tokens[-1], int) and not literal[0].isspace():
+            return None
+        tokens.extend(literal.split())
+        literal = ""
+
+        if field_name == "":
+            has_auto_fields = True
+            tokens.append(auto_idx)
+            auto_idx += 1
+        elif field_name.isdigit():
+            has_manual_fields = True
+            tokens.append(int(field_name))
+        else:
+            return None
+
+    if literal and tokens and isinstance(tokens[-1], int) and not literal[0].isspace():
+        return None
+    tokens.extend(literal.split())
+
+    # Mixing automatic and manual field numbering is an error, left for str.format to raise
+    if has_auto_fields and has_manual_fields:
+        return None
+    return tokens
+
+
 class RegexRealizer(SlotRealizerComponent):
+    __slots__ = (
+        "registry",
+        "languages",
+        "regex",
+        "_pattern",
+        "_prefix",
+        "_cached_groups",
+        "templates",
+        "_templates_tokens",
+        "group_requirements",
+        "slot_requirements",
+        "attach_attributes_to",
+        "add_attributes",
+    )
+
+    groups_cache_size = 1024
+
     def __init__(
         self,
         registry: Registry,
@@ -121,7 +215,12 @@ class RegexRealizer(SlotRealizerComponent):
         self.registry = registry
         self.languages = languages if isinstance(languages, list) else [languages]
         self.regex = regex
-        self.templates = [template] if isinstance(template, str) else template
+        self._pattern = re.compile(regex)
+        # Values not starting with the literal prefix of the regex can be rejected without running the regex
+        self._prefix = literal_prefix(regex)
+        self._cached_groups = lru_cache(maxsize=self.groups_cache_size)(self._groups)
+        self.templates = [template] if isinstance(template, str) else list(template)
+        self._templates_tokens = [_tokenize_template(template) for template in self.templates]
         self.group_requirements = group_requirements
         self.slot_requirements = slot_requirements
         self.attach_attributes_to = attach_attributes_to if attach_attributes_to is not None else []
@@ -130,53 +229,68 @@ class RegexRealizer(SlotRealizerComponent):
     def supported_languages(self) -> List[str]:
         return self.languages
 
+    def _groups(self, value: str) -> Optional[Tuple[Optional[str], ...]]:
+        # The groups of the full match of the value, or None if the value did not match
+        match = self._pattern.fullmatch(value)
+        return match.groups() if match else None
+
     def realize(self, slot: Slot, random: Generator) -> Tuple[bool, List[TemplateComponent]]:
         # We can only parse the slot contents with a regex if the slot contents are a string
-        if not isinstance(slot.value, str):
+        value = slot.value
+        if not isinstance(value, str) or not value.startswith(self._prefix):
             return False, []
 
-        match = re.fullmatch(self.regex, slot.value)
+        # The same values recur in many slots, so the regex results of recently seen values are cached. The outcome of
+        # the match does not depend on the random generator, so caching it does not change the realizations.
+        groups = self._cached_groups(value)
 
-        if not match:
+        if groups is None:
             return False, []
 
         # Check that the requirements placed on the groups are fulfilled
-        if self.group_requirements is not None and not self.group_requirements(*match.groups()):
+        if self.group_requirements is not None and not self.group_requirements(*groups):
             return False, []
 
         # Check that the requirements placed on the slot are fulfilled
         if self.slot_requirements is not None and not self.slot_requirements(slot):
             return False, []
 
-        template = random.choice(self.templates)
+        # Equivalent to random.choice(self.templates), which draws the index with random.integers, but without
+        # converting the templates to an array. Drawing from a range of one consumes no randomness, so the single
+        # template case can skip the draw altogether.
+        template_idx = 0 if len(self.templates) == 1 else random.integers(len(self.templates))
+        template = self.templates[template_idx]
         log.debug("'Template: {}".format(template))
 
-        string_realization = template.format(*match.groups())
-        log.debug("String realization: {}".format(string_realization))
+        template_tokens = self._templates_tokens[template_idx]
+        if template_tokens is None:
+            realization_tokens = template.format(*groups).split()
+        else:
+            # Same as formatting the template and splitting the result, but only the groups need to be split
+            realization_tokens = []
+            for template_token in template_tokens:
+                if isinstance(template_token, str):
+                    realization_tokens.append(template_token)
+                else:
+                    realization_tokens.extend(str(groups[template_token]).split())
+        log.debug("String realization: {}".format(" ".join(realization_tokens)))
 
         components = []
-        for idx, realization_token in enumerate(string_realization.split()):
-            new_slot = slot.copy(include_fact=True)
-
-            # By default, copy copies the attributes too. In case attach_attributes_to was set,
-            # we need to explicitly reset the attributes for all those slots NOT explicitly mentioned
-            if idx not in self.attach_attributes_to:
-                new_slot.attributes = {}
-
-            for attribute, value in self.add_attributes.get(idx, {}).items():
-                new_slot.attributes[attribute] = value
-
-            # An ugly hack that ensures the lambda correctly binds to the value of realization_token at this
-            # time. Without this, all the lambdas bind to the final value of the realization_token variable, ie.
-            # the final value at the end of the loop.  See https://stackoverflow.com/a/10452819
-            new_slot.value = lambda f, realization_token=realization_token: realization_token
-            components.append(new_slot)
+        for idx, realization_token in enumerate(realization_tokens):
+            # The attributes of the original slot are only carried over to the slots explicitly mentioned in
+            # attach_attributes_to. The new slot is constructed directly, rather than copying the original slot and
+            # then discarding the copied attributes and value.
+            attributes = slot.attributes.copy() if idx in self.attach_attributes_to else {}
+            attributes.update(self.add_attributes.get(idx, {}))
+            components.append(Slot(LiteralSource(realization_token), attributes, slot.fact, slot.slot_type))
         log.debug("Components: {}".format([str(c) for c in components]))
 
         return True, components
 
 
 class LookupRealizer(SlotRealizerComponent):
+    __slots__ = ("registry", "languages", "dictionary", "_tokenized_dictionary", "attach_attributes_to")
+
     def __init__(
         self,
         registry: Registry,
@@ -187,6 +301,8 @@ class LookupRealizer(SlotRealizerComponent):
         self.registry = registry
         self.languages = languages if isinstance(languages, list) else [languages]
         self.dictionary = dictionary
+        # The dictionary is fixed after construction, so the realizations are only tokenized once
+        self._tokenized_dictionary = {key: value.split() for key, value in dictionary.items()}
         self.attach_attributes_to = attach_attributes_to if attach_attributes_to is not None else []
 
     def supported_languages(self) -> List[str]:
@@ -197,25 +313,17 @@ class LookupRealizer(SlotRealizerComponent):
         if not isinstance(slot.value, str):
             return False, []
 
-        string_realization = self.dictionary.get(slot.value)
-        if string_realization is None:
+        realization_tokens = self._tokenized_dictionary.get(slot.value)
+        if realization_tokens is None:
             return False, []
 
-        log.debug("String realization: {}".format(string_realization))
+        log.debug("String realization: {}".format(" ".join(realization_tokens)))
         components = []
-        for idx, realization_token in enumerate(string_realization.split()):
-            new_slot = slot.copy(include_fact=True)
-
-            # By default, copy copies the attributes too. In case attach_attributes_to was set,
-            # we need to explicitly reset the attributes for all those slots NOT explicitly mentioned
-            if idx not in self.attach_attributes_to:
-                new_slot.attributes = {}
-
-            # An ugly hack that ensures the lambda correctly binds to the value of realization_token at this
-            # time. Without this, all the lambdas bind to the final value of the realization_token variable, ie.
-            # the final value at the end of the loop.  See https://stackoverflow.com/a/10452819
-            new_slot.value = lambda f, realization_token=realization_token: realization_token
-            components.append(new_slot)
+        for idx, realization_token in enumerate(realization_tokens):
+            # The attributes of the original slot are only carried over to the slots explicitly mentioned in
+            # attach_attributes_to
+            attributes = slot.attributes.copy() if idx in self.attach_attributes_to else {}
+            components.append(Slot(LiteralSource(realization_token), attributes, slot.fact, slot.slot_type))
         log.debug("Components: {}".format([str(c) for c in components]))
 
         return True, components
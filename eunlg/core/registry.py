@@ -20,7 +20,7 @@ class Registry(object):
             self._registry[name] = service
 
     def get(self, name: str) -> Any:
-        if name not in self._registry:
-            raise UnknownComponentException("No component named '{}'".format(name))
-        else:
+        try:
             return self._registry[name]
+        except KeyError:
+            raise UnknownComponentException("No component named '{}'".format(name)) from None
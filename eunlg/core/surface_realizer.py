@@ -1,5 +1,4 @@
 import logging
-import re
 
 from numpy import random
 
@@ -19,25 +18,12 @@ class SurfaceRealizer(NLGPipelineComponent):
     of sentences as children.
     """
 
-    @property
-    def paragraph_start(self):
-        raise NotImplementedError
-
-    @property
-    def paragraph_end(self):
-        raise NotImplementedError
-
-    @property
-    def sentence_start(self):
-        raise NotImplementedError
-
-    @property
-    def sentence_end(self):
-        raise NotImplementedError
-
-    @property
-    def fail_on_empty(self):
-        raise NotImplementedError
+    # Defined by the subclasses
+    paragraph_start: str
+    paragraph_end: str
+    sentence_start: str
+    sentence_end: str
+    fail_on_empty: bool
 
     def run(self, registry: Registry, random: random.Generator, language: str, document_plan: DocumentPlanNode) -> str:
         """
@@ -46,23 +32,21 @@ class SurfaceRealizer(NLGPipelineComponent):
         log.info("Realizing to text")
         sequences = [c for c in document_plan.children]
         paragraphs = [self.realize(s) for s in sequences]
-        output = ""
+        output = []
         for p in paragraphs:
-            output += self.paragraph_start + p + self.paragraph_end
-        return output
+            output.extend((self.paragraph_start, p, self.paragraph_end))
+        return "".join(output)
 
     def realize(self, sequence: DocumentPlanNode) -> str:
         """Realizes a single paragraph."""
-        output = ""
+        output = []
         for message in sequence.children:
-            template = message.template
-            component_values = [str(component.value) for component in template.components]
-
-            sent = " ".join([component_value for component_value in component_values if component_value != ""]).rstrip()
-            # Temp fix: remove extra spaces occurring with braces and sometimes before commas.
-            sent = re.sub(r"\(\s", r"(", sent)
-            sent = re.sub(r"\s\)", r")", sent)
-            sent = re.sub(r"\s,", r",", sent)
+            # Each component value is evaluated and stringified once, and empty values are dropped in the same pass
+            component_values = (str(component.value) for component in message.template.components)
+            sent = " ".join([component_value for component_value in component_values if component_value]).rstrip()
+            # Temp fix: remove extra spaces occurring with braces and sometimes before commas. The component values
+            # were joined with single spaces above, so plain string replacement suffices.
+            sent = sent.replace("( ", "(").replace(" )", ")").replace(" ,", ",")
 
             if not sent:
                 if self.fail_on_empty:
@@ -70,8 +54,8 @@ class SurfaceRealizer(NLGPipelineComponent):
                 else:
                     continue
             sent = sent[0].upper() + sent[1:]
-            output += self.sentence_start + sent + self.sentence_end
-        return output
+            output.extend((self.sentence_start, sent, self.sentence_end))
+        return "".join(output)
 
 
 class HeadlineHTMLSurfaceRealizer(SurfaceRealizer):
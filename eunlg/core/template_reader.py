@@ -35,9 +35,13 @@ This is exactly equivalent to putting the expanded templates explicitly on conse
 the same language specifier).
 
 """
+import itertools
 import logging
 import re
+import sys
 import warnings
+from functools import lru_cache
+from types import MappingProxyType
 from typing import Dict, List, Optional, Tuple
 
 from .models import (
@@ -73,14 +77,17 @@ FACT_FIELD_ALIASES = {
     "time": [],
     "unit": [],
 }
-FACT_FIELD_MAP = canonical_map(FACT_FIELD_ALIASES)
+# The lookup tables are read-only. The canonical names are the keys of the alias dicts above, i.e. interned literals.
+FACT_FIELD_MAP = MappingProxyType(canonical_map(FACT_FIELD_ALIASES))
 LOCATION_TYPES = {"C": ["country"], "D": ["district"], "M": ["municipality", "mun"]}
-LOCATION_TYPE_MAP = canonical_map(LOCATION_TYPES)
-FACT_FIELDS = FACT_FIELD_ALIASES.keys()
+LOCATION_TYPE_MAP = MappingProxyType(canonical_map(LOCATION_TYPES))
+FACT_FIELDS = frozenset(FACT_FIELD_ALIASES)
 
 RULE_PREFIX = "|"
 
 field_name_re = re.compile(r"[^ |=]+")
+# Longest operators first, s.t. e.g. ">=" is not read as ">" followed by a value starting with "="
+operator_re = re.compile("|".join(re.escape(op) for op in sorted(Matcher.OPERATORS, key=len, reverse=True)))
 rhs_value_re = re.compile(r"[^,]+")
 
 value_groups = {}
@@ -90,14 +97,23 @@ Referential values start with 1 or more numerals, followed by a dot.
 The dot is followed by any one of the strings "who", "where" or "what",
 or their variants with "_type" appended.
 
-1st capture group is the part before the dot.
-2nd capture group is the part after the dot.
+The "ref_idx" group is the part before the dot, the "ref_field" group the part after it.
+
+The same pattern also recognizes values wrapped in matching single or double quotes, capturing the part inside the
+quotes as "quoted". A lone quote character counts as an empty quoted string.
 """
-referential_value_re = re.compile(r"^(\d+)\.((?:who|where|what)(?:_type)?|when(?:_1|_2|_type))$")
-# TODO: referential_value_re needs to be either more generic or dynamically built from the fields of Fact
+matcher_value_re = re.compile(
+    r"^(?:(?P<ref_idx>\d+)\.(?P<ref_field>(?:who|where|what)(?:_type)?|when(?:_1|_2|_type))"
+    r"|(?P<quote>['\"])(?:(?P<quoted>.*)(?P=quote))?)$"
+)
+# TODO: matcher_value_re needs to be either more generic or dynamically built from the fields of Fact
 
 lang_spec_re = re.compile(r"(?P<lang>\S*):\s(?P<template>.*)")
 multi_space_re = re.compile(r"\s+")
+optional_part_re = re.compile(r"\[([^\]]*)\]")
+# A substitution within braces, a whitespace-delimited literal, or an opening brace that is missing its closing brace.
+# As before, a lone opening brace at the very end of a template line is ignored.
+template_token_re = re.compile(r"\{([^}]*)\}|([^\s{]+)|\{(?=.)")
 
 
 def read_templates_file(filename: str, initial_language: Optional[str] = None, return_what_types: bool = False):
@@ -131,7 +147,24 @@ def read_templates(
     seen_what_types = set()
     current_language = initial_language
 
-    group_definitions = [line for line in data.splitlines() if line.startswith("$")]
+    # Read the data in a single pass: group definition lines, starting with a '$', are collected separately, comment
+    # lines, starting with a '#', are removed and the rest are split on blank lines to separate the templates
+    group_definitions = []
+    line_groups = []
+    line_group = []
+    for line in data.splitlines():
+        if not line:
+            # Ignore consecutive blank lines (empty group)
+            if line_group:
+                line_groups.append(line_group)
+                line_group = []
+        elif line[0] == "$":
+            group_definitions.append(line)
+        elif line[0] != "#":
+            line_group.append(line)
+    if line_group:
+        line_groups.append(line_group)
+
     for line in group_definitions:
         group_name, _, rest = line[1:].partition(":")
         if group_name[0] != "{" or group_name[-1] != "}":
@@ -143,17 +176,13 @@ def read_templates(
         group_values = set([value.strip() for value in rest.split(",")])
         value_groups[group_name] = group_values
 
-    # Remove all comment lines, beginning with a '#', and group definition lines, starting with a '$'
-    lines = [line for line in data.splitlines() if not (line.startswith("#") or line.startswith("$"))]
-
-    # Split on blank lines to separate the templates
-    for line_group in blank_line_split(lines):
+    for line_group in line_groups:
         # Parse each group of lines to get a load of template and add them to the dictionary
         # Update the default language to the last one used in the group
         new_templates, current_language, new_what_types = read_template_group(
             line_group, current_language=current_language
         )
-        seen_what_types = seen_what_types.union(new_what_types)
+        seen_what_types.update(new_what_types)
 
         for lang, lang_templates in new_templates.items():
             templates.setdefault(lang, []).extend(lang_templates)
@@ -188,10 +217,14 @@ def read_template_group(
 
     # Allow changing the current language without any templates
     # This is mostly used to specify a monolingual set of templates, defining the language and letting it carry through
-    lang_name, colon, rest = "".join(lines).strip().partition(":")
-    if colon and len(rest) == 0:
-        # Return no templates and update the current language
-        return {}, lang_name
+    # Such a block ends in its only colon, so the lines are only joined up to check this if the last non-blank one ends
+    # in a colon
+    last_line = next((line.rstrip() for line in reversed(lines) if line.strip()), "")
+    if last_line.endswith(":"):
+        lang_name, colon, rest = "".join(lines).strip().partition(":")
+        if colon and len(rest) == 0:
+            # Return no templates and update the current language
+            return {}, lang_name
 
     # Detect whether this template is specified in the new or old format. Templates using the old format are
     # ignored.
@@ -238,6 +271,10 @@ def read_template_group(
     # TEMPLATES
     # Now we parse the template lines themselves
     templates = {}
+    # All templates of the group share the same constraints
+    rules_str = "\n".join(constraint_lines)
+    # Looked up for every substitution below, so bound to locals once
+    fact_field_map, fact_fields = FACT_FIELD_MAP, FACT_FIELDS
     for template_line in template_lines:
         # Work out what language this template is for
         lang_id_match = lang_spec_re.match(template_line)
@@ -246,8 +283,9 @@ def read_template_group(
             pass
         else:
             language, template_line = lang_id_match.groups()
-            # Make language specifiers case insensitive
-            language = language.lower()
+            # Make language specifiers case insensitive. The ids come from a handful of languages and key the template
+            # dicts, so they are interned
+            language = sys.intern(language.lower())
             # If empty language spec, use default language (and strip away the colon prefix)
             if len(language) > 0:
                 # Otherwise, switch the current language, so it gets used for this template and becomes the default
@@ -258,108 +296,90 @@ def read_template_group(
             components = []  # type: List[TemplateComponent]
 
             # Generate list for mapping rules into template Slots
-            rule_to_slot = []  # type: List[List[int]]
-            for idx in range(len(rules)):
-                rule_to_slot.append([])
-
-            rest = expanded_template_line.strip()
-            while len(rest.strip()):
-                # Look for the next opening brace marking a substitution
-                literal_part, __, rest = rest.partition("{")
-                # Everything up to the brace is a literal
-                if len(literal_part) > 0:
-                    # To make life easier for the aggregator, literals are split on whitespace here
-                    for literal in literal_part.split():
-                        components.append(Literal(literal))
-                # If no brace was found, we're done
-                if len(rest) > 0:
-                    # Look for the closing brace
-                    subst, closer, rest = rest.partition("}")
-                    if not closer:
-                        raise TemplateReadingError("closing brace missing in {}".format(expanded_template_line))
-                    # Split up the substitution spec on commas, to allow various attributes and filters to be included
-                    subst_parts = [p.strip() for p in subst.split(",")]
-
-                    # First check if the first part is actually a literal.
-                    if subst_parts[0][0] in ['"', "'"]:
-                        if subst_parts[0][-1] != subst_parts[0][0]:
-                            raise TemplateReadingError("closing quote missing in {}".format(expanded_template_line))
-                        field_name = subst_parts[0]
-                        rule_ref = None
-                    else:
-                        # The first thing is the base value to substitute, which should be one of the fact fields
-                        # or the new {time} slot, which refers to both when-fields
-                        field_name = subst_parts[0]
-
-                        # It may specify which of the facts it's referring to, though this is not required
-                        # (default to first)
-                        if "." in field_name:
-                            rule_ref, __, field_name = field_name.partition(".")
-                            # Use 1-indexed fact numbering in templates: makes more sense for anyone but
-                            # computer scientists
-                            rule_ref = int(rule_ref) - 1
-                            if rule_ref < 0:
-                                raise TemplateReadingError(
-                                    "Rule references use 1-index numbering. Found reference to rule "
-                                    "0: did you mean 1?"
-                                )
-                        else:
-                            # Default to referring to the first rule, since there's usually only one
-                            rule_ref = 0
-
-                        # Map alternative field names to their canonical form used internally
-                        try:
-                            field_name = FACT_FIELD_MAP[field_name]
-                        except KeyError:
-                            raise TemplateReadingError(
-                                "unknown fact field '{}' used in substitution ({})".format(field_name, subst)
-                            )
-
-                        # Only some of the field names are allowed to be used in templates
-                        # TODO: Remove or reinstate with allowed things received as params from "somewhere"
-                        if field_name not in FACT_FIELDS:
-                            raise TemplateReadingError(
-                                "invalid field name '{}' for use in a template: {}".format(
-                                    field_name, expanded_template_line
-                                )
-                            )
-
-                        if rule_ref >= len(rules):
+            rule_to_slot = [[] for _ in rules]  # type: List[List[int]]
+
+            for token_match in template_token_re.finditer(expanded_template_line):
+                subst, literal = token_match.groups()
+                if literal is not None:
+                    # Literals are split on whitespace by the tokenizer, to make life easier for the aggregator
+                    components.append(Literal(literal))
+                    continue
+                if subst is None:
+                    # An opening brace without a closing one
+                    raise TemplateReadingError("closing brace missing in {}".format(expanded_template_line))
+                # Split up the substitution spec on commas, to allow various attributes and filters to be included
+                subst_parts = [p.strip() for p in subst.split(",")]
+
+                # First check if the first part is actually a literal.
+                if subst_parts[0][0] in ['"', "'"]:
+                    if subst_parts[0][-1] != subst_parts[0][0]:
+                        raise TemplateReadingError("closing quote missing in {}".format(expanded_template_line))
+                    field_name = subst_parts[0]
+                    rule_ref = None
+                else:
+                    # The first thing is the base value to substitute, which should be one of the fact fields
+                    # or the new {time} slot, which refers to both when-fields
+                    field_name = subst_parts[0]
+
+                    # It may specify which of the facts it's referring to, though this is not required
+                    # (default to first)
+                    if "." in field_name:
+                        rule_ref, __, field_name = field_name.partition(".")
+                        # Use 1-indexed fact numbering in templates: makes more sense for anyone but
+                        # computer scientists
+                        rule_ref = int(rule_ref) - 1
+                        if rule_ref < 0:
                             raise TemplateReadingError(
-                                "Substitution '{}' refers to rule {}, but template only has {} "
-                                "rules".format(subst, rule_ref + 1, len(rules))
+                                "Rule references use 1-index numbering. Found reference to rule "
+                                "0: did you mean 1?"
                             )
-
-                    attributes = {}
-                    # Read each of the attribute specifications
-                    for subst_part in subst_parts[1:]:
-                        if "=" in subst_part:
-                            # Attributes specify things like case, to be used in realisation
-                            att, __, val = subst_part.partition("=")
-                            attributes[att.strip()] = val.strip()
-                        else:
-                            # Key-only attributes such as "abs" or "ord" are also possible
-                            attributes[subst_part] = True
-
-                    if field_name[0] in ["'", '"']:
-                        to_value = LiteralSource(field_name[1:-1])
-                    elif field_name == "time":
-                        to_value = TimeSource()
-                    elif field_name == "unit":
-                        to_value = UnitSource()
                     else:
-                        to_value = FactFieldSource(field_name)
-
-                    # Postprocess attributes
-                    attributes = process_attributes(attributes)
+                        # Default to referring to the first rule, since there's usually only one
+                        rule_ref = 0
+
+                    # Map alternative field names to their canonical form used internally
+                    try:
+                        field_name = fact_field_map[field_name]
+                    except KeyError:
+                        raise TemplateReadingError(
+                            "unknown fact field '{}' used in substitution ({})".format(field_name, subst)
+                        )
+
+                    # Only some of the field names are allowed to be used in templates
+                    # TODO: Remove or reinstate with allowed things received as params from "somewhere"
+                    if field_name not in fact_fields:
+                        raise TemplateReadingError(
+                            "invalid field name '{}' for use in a template: {}".format(
+                                field_name, expanded_template_line
+                            )
+                        )
+
+                    if rule_ref >= len(rules):
+                        raise TemplateReadingError(
+                            "Substitution '{}' refers to rule {}, but template only has {} "
+                            "rules".format(subst, rule_ref + 1, len(rules))
+                        )
+
+                # Most substitutions have no attributes at all, in which case the Slot creates its own empty dict
+                attributes = read_attributes(subst_parts[1:]) if len(subst_parts) > 1 else None
+
+                if field_name[0] in ["'", '"']:
+                    to_value = LiteralSource(field_name[1:-1])
+                elif field_name == "time":
+                    to_value = TimeSource()
+                elif field_name == "unit":
+                    to_value = UnitSource()
+                else:
+                    to_value = FactFieldSource(field_name)
 
-                    # len(components) is the index for the next component to be added
-                    if rule_ref is not None:
-                        rule_to_slot[rule_ref].append(len(components))
-                    new_slot = Slot(to_value, attributes=attributes)
-                    components.append(new_slot)
+                # len(components) is the index for the next component to be added
+                if rule_ref is not None:
+                    rule_to_slot[rule_ref].append(len(components))
+                new_slot = Slot(to_value, attributes=attributes)
+                components.append(new_slot)
 
-            template = Template(components, list(zip(rules, rule_to_slot)), "\n".join(constraint_lines))
+            # The slot indices of each rule are fixed from here on, so they are stored as tuples
+            template = Template(components, list(zip(rules, map(tuple, rule_to_slot))), rules_str)
             # Add this template to the list for the relevant language
             templates.setdefault(current_language, []).append(template)
 
@@ -367,19 +387,21 @@ def read_template_group(
 
 
 def parse_matcher_expr(constraint_line: str):
+    # Looked up for every constraint on the line, so bound to a local once
+    fact_field_map = FACT_FIELD_MAP
     rest = constraint_line
     while rest.strip():
         rest = rest.strip()
         # First part should be a LHS expr
         lhs, rest = parse_matcher_lhs(rest)
         # The next thing is the operator between the LHS and RHS
-        try:
-            op = next(opr for opr in Matcher.OPERATORS if rest.startswith(opr))
-        except StopIteration:
+        op_match = operator_re.match(rest)
+        if op_match is None:
             raise TemplateReadingError(
                 "unrecognised operator at start of '{}'. Should be one of {}".format(rest, ", ".join(Matcher.OPERATORS))
             )
-        rest = rest[len(op) :].strip()
+        op = op_match.group()
+        rest = rest[op_match.end() :].strip()
 
         # The value is now everything up to the next , or the end
         value_match = rhs_value_re.match(rest)
@@ -390,7 +412,7 @@ def parse_matcher_expr(constraint_line: str):
 
         # If the field name (name = value) isn't one we know, we assume that it's a shorthand for:
         #  what_type = name, what = value
-        if lhs.field_name not in FACT_FIELD_MAP:
+        if lhs.field_name not in fact_field_map:
             # First yield the what_type=name constraint
             yield FactField("value_type"), "=", lhs.field_name
             # Continue with parsing the RHS as if we'd got a what specifier
@@ -410,23 +432,21 @@ def parse_matcher_expr(constraint_line: str):
         elif lhs.field_name != "value_type":
             # Don't do RHS parsing for what_type
             # Special case: value references another fact???
-            matches = referential_value_re.match(value)
-            if matches:
-                idx, field = matches.group(1), matches.group(2)
+            matches = matcher_value_re.match(value)
+            if matches and matches.group("ref_idx"):
+                idx, field = matches.group("ref_idx"), matches.group("ref_field")
                 # Translate from 1-based indexing to 0-based indexing
                 idx = int(idx) - 1
                 value = ReferentialExpr(idx, field)
-            elif value in FACT_FIELD_MAP:
+            elif matches:
+                # You don't need to put strings in quotes, but if someone wants to, let them do so
+                value = matches.group("quoted") or ""
+            elif value in fact_field_map:
                 value = FactField(value)
             else:
                 # It's a normal value
                 # Allow ints and floats to be written without any special typing: just detect them
                 value = detect_types(value)
-                # You don't need to put strings in quotes, but if someone wants to, let them do so
-                if type(value) is str and (
-                    (value[0] == "'" and value[-1] == "'") or (value[0] == '"' and value[-1] == '"')
-                ):
-                    value = value[1:-1]
         yield lhs, op, value_groups.get(value, value)
 
 
@@ -473,27 +493,36 @@ CASE_NAMES = {
     "essive": ["essiivi", "ess"],
     "translative": ["translatiivi", "tra"],
 }
-
-
-def process_attributes(attrs):
-    """Post-processing of attribute dictionaries for slots"""
-    proc_attrs = {}
-    for attr, val in attrs.items():
+CASE_NAME_MAP = MappingProxyType(canonical_map(CASE_NAMES))
+
+
+def read_attributes(attribute_specs):
+    """Build the attribute dictionary of a slot from the attribute specifications of its substitution"""
+    attributes = {}
+    # Read each of the attribute specifications
+    for attribute_spec in attribute_specs:
+        if "=" in attribute_spec:
+            # Attributes specify things like case, to be used in realisation
+            attr, __, val = attribute_spec.partition("=")
+            attr, val = sys.intern(attr.strip()), val.strip()
+        else:
+            # Key-only attributes such as "abs" or "ord" are also possible
+            attr, val = sys.intern(attribute_spec), True
         if attr == "case":
             # Look for the case in the dict of alternative names
             try:
-                case_name = next(case for (case, alts) in CASE_NAMES.items() if case == val or val in alts)
-            except StopIteration:
+                val = CASE_NAME_MAP[val]
+            except KeyError:
                 log.info(
                     "unknown case name '{}', using the given form and hoping that Omorfi recognizes it".format(val)
                 )
-                case_name = val
-            proc_attrs[attr] = case_name
-        else:
-            proc_attrs[attr] = val
-    return proc_attrs
+                if isinstance(val, str):
+                    val = sys.intern(val)
+        attributes[attr] = val
+    return attributes
 
 
+@lru_cache(maxsize=4096)
 def detect_types(value):
     if value == "True":
         return True
@@ -511,28 +540,10 @@ def detect_types(value):
     return value
 
 
-def blank_line_split(seq):
-    """
-    Group subseqences of the given string sequence, split by blank lines.
-    """
-    group = []
-    for line in seq:
-        if len(line) == 0:
-            # Ignore consecutive blank lines (empty group)
-            if len(group):
-                yield group
-                group = []
-        else:
-            group.append(line)
-    # Yield the final group
-    if len(group):
-        yield group
-
-
 def group_indented_lines(seq):
     group = [seq[0].strip()]
     for line in seq[1:]:
-        if re.match(r"\s", line):
+        if line[:1].isspace():
             # Indented line, group with the previous
             group.append(line.strip())
         else:
@@ -542,42 +553,34 @@ def group_indented_lines(seq):
     yield " ".join(group)
 
 
+@lru_cache(maxsize=1024)
 def expand_alternatives(line):
     """
     Expand out a template line containing optional parts delimited by []s into multiple template lines
-    for the different versions.
+    for the different versions. The same lines recur throughout the template files, so the results are cached.
 
     :param line: raw line
-    :return: list of alternatives
+    :return: tuple of alternatives
     """
-    alts = [""]
-
-    def add_to_alts(old_alts, new_alts):
-        return ["{}{}".format(old_alt, new_alt) for old_alt in old_alts for new_alt in new_alts]
-
-    rest = line
-    while len(rest):
-        before_bracket, bracket, rest = rest.partition("[")
-        # Add everything up to the next bracket to every existing alternative
-        alts = add_to_alts(alts, [before_bracket])
-        if bracket:
-            # We found an opening bracket: look for the closing one
-            in_bracket, closing_bracket, rest = rest.partition("]")
-            if not closing_bracket:
-                raise TemplateReadingError("unmatched square bracket in template line: {}".format(line))
-            # Expand out all the alternatives we've already got to versions that add the contents of the brackets
-            # and versions that don't
-            alts = add_to_alts(alts, [in_bracket, ""])
+    if "[" not in line:
+        # Most lines have no optional parts: only normalize the whitespace as below
+        return (" ".join(line.split()),)
+    # Split the line into fixed parts (even indices) and the contents of the optional parts (odd indices)
+    parts = optional_part_re.split(line)
+    if any("[" in fixed_part for fixed_part in parts[::2]):
+        raise TemplateReadingError("unmatched square bracket in template line: {}".format(line))
+    # Every combination of including and excluding the optional parts, versions including a part coming first
+    choices = [(part,) if idx % 2 == 0 else (part, "") for idx, part in enumerate(parts)]
     # Strip whitespace, so we don't have to worry about spaces before optional parts ending up at the end of templates
-    alts = [x.strip() for x in alts]
     # Also replace any strings of multiple spaces with single spaces
     # This is because it's not intuitive to write "I [really ]want", but rather "I [really] want", even though the
     #  latter strictly speaking should have two consecutive spaces in the version without the optional text
-    alts = [multi_space_re.sub(" ", alt) for alt in alts]
-    return alts
+    return tuple(multi_space_re.sub(" ", "".join(combination).strip()) for combination in itertools.product(*choices))
 
 
 class TemplateReadingError(Exception):
-    def __init__(self, *args, **kwargs):
-        self.raw_text = kwargs.pop("raw_text", None)
-        super().__init__(*args, **kwargs)
+    __slots__ = ("raw_text",)
+
+    def __init__(self, *args, raw_text: Optional[str] = None):
+        self.raw_text = raw_text
+        super().__init__(*args)
@@ -1,6 +1,5 @@
 import logging
-from functools import lru_cache
-from typing import Iterator, List, Optional, Tuple
+from typing import Dict, FrozenSet, Iterator, List, Optional, Tuple
 
 from numpy.random import Generator
 
@@ -66,7 +65,9 @@ class TemplateSelector(NLGPipelineComponent):
                     log.error("Found no templates to express {}".format(child))
                     raise Exception("No template for message {}".format(child))
                 else:
-                    templates = self._filter_by_context(templates, context, child, is_first=(idx == 0))
+                    templates = self._filter_by_context(
+                        templates, template_checker.slot_types, context, child, is_first=(idx == 0)
+                    )
                     random.shuffle(templates)
                     template = templates[0]
                     self._add_template_to_message(child, template, all_messages)
@@ -87,58 +88,56 @@ class TemplateSelector(NLGPipelineComponent):
         return first_type == second_type
 
     def _filter_by_context(
-        self, templates: List[Template], context: Optional[Message], this: Message, is_first: bool
+        self,
+        templates: List[Template],
+        slot_types: Dict[Template, FrozenSet[str]],
+        context: Optional[Message],
+        this: Message,
+        is_first: bool,
     ) -> List[Template]:
-        log.debug("Filtering templates by context. Initial templates:")
-        for t in templates:
-            log.debug("\t{}".format(t))
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("Filtering templates by context. Initial templates:")
+            for t in templates:
+                log.debug("\t{}".format(t))
 
-        # Filter s.t. location is either mandatory present or absent based on context
-        if (
+        # Whether the time, the location and the value_type are left out of the template (True) or must be mentioned
+        # (False), based on the context
+        omit_time = bool(
             context
             and context.main_fact.timestamp == this.main_fact.timestamp
             and context.main_fact.timestamp_type == this.main_fact.timestamp_type
-        ):
-            proposed = [template for template in templates if not template.has_slot_of_type("time")]
-        else:
-            proposed = [template for template in templates if template.has_slot_of_type("time")]
-
-        # Only update proper list if above filter did *not* result in empty set
-        if proposed:
-            log.debug("Non-empty filtered list after location filter, checkpointing")
-            templates = proposed
-
-        # Filter s.t. location is either mandatory present or absent based on context
-        if (
+        )
+        omit_location = bool(
             context
             and context.main_fact.location == this.main_fact.location
             and context.main_fact.location_type == this.main_fact.location_type
-        ):
-            proposed = [template for template in templates if not template.has_slot_of_type("location")]
-        else:
-            proposed = [template for template in templates if template.has_slot_of_type("location")]
-
-        # Only update proper list if above filter did *not* result in empty set
-        if proposed:
-            log.debug("Non-empty filtered list after location filter, checkpointing")
-            templates = proposed
-
-        # Filter s.t. value_type is either mandatory present or absent based on context
-        if context and self._value_type_is_substantially_similar(context, this) and not is_first:
-            proposed = [template for template in templates if not template.has_slot_of_type("value_type")]
-        else:
-            proposed = [template for template in templates if template.has_slot_of_type("value_type")]
-
-        # Only update proper list if above filter did *not* result in empty set
-        if proposed:
-            log.debug("Non-empty filtered list after location filter, checkpointing")
-            templates = proposed
+        )
+        omit_value_type = bool(context and self._value_type_is_substantially_similar(context, this) and not is_first)
+
+        # The filters are applied in order of priority: time, location and then value_type. A filter is skipped if it
+        # would leave no templates, so the templates that pass the most important filters win. Scoring each template
+        # with a bit per filter, in the same priority order, finds them in a single pass.
+        best_score = -1
+        filtered = []  # type: List[Template]
+        for template in templates:
+            template_slot_types = slot_types[template]
+            score = (
+                4 * (("time" in template_slot_types) != omit_time)
+                + 2 * (("location" in template_slot_types) != omit_location)
+                + (("value_type" in template_slot_types) != omit_value_type)
+            )
+            if score > best_score:
+                best_score = score
+                filtered = [template]
+            elif score == best_score:
+                filtered.append(template)
 
-        log.debug("Filtered templates:")
-        for t in templates:
-            log.debug("\t{}".format(t))
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("Filtered templates:")
+            for t in filtered:
+                log.debug("\t{}".format(t))
 
-        return templates
+        return filtered
 
     @staticmethod
     def _add_template_to_message(message: Message, template_original: Template, all_messages: List[Message]) -> None:
@@ -172,31 +171,58 @@ class TemplateMessageChecker(object):
 
     Init with templates taken from the registry for the relevant language.
 
-    The checks are cached on message and location_required.
+    The checks are cached on message.
 
     """
 
     def __init__(self, templates: List[Template], all_messages: List[Message]) -> None:
         self.all_messages = all_messages
         self.templates = templates
-        self._cache = {}
+        # Results of exists_template_for_message. Messages hash by identity, and the cache lives only as long as
+        # the checker does.
+        self._cache = {}  # type: Dict[Message, bool]
+        # The slot types of each template, for filtering the matching templates by context. The templates in the
+        # registry are never modified (only their copies are filled), so these are computed once.
+        self.slot_types = {
+            template: frozenset(slot.slot_type for slot in template.slots) for template in templates
+        }  # type: Dict[Template, FrozenSet[str]]
+        # Most templates only express messages whose value_type starts with some fixed prefix (e.g. "cphi:"). The
+        # templates whose prefix the value_type of a message doesn't start with need not be checked for it at all.
+        self._value_type_prefixes = [
+            (template, template.primary_value_type_prefix()) for template in templates
+        ]  # type: List[Tuple[Template, str]]
+        self._templates_by_value_type = {}  # type: Dict[str, List[Template]]
 
-    @lru_cache(maxsize=1024)
     def exists_template_for_message(self, message: Message) -> bool:
         """
         Check for templates that apply to the given message. To make things faster, we don't try to find
         all available templates, but return as soon as we find one.
         """
+        try:
+            return self._cache[message]
+        except KeyError:
+            pass
         try:
             # Try getting the first template
             next(self.all_templates_for_message(message))
+            exists = True
         except StopIteration:
             # No template found at all
-            return False
-        return True
+            exists = False
+        self._cache[message] = exists
+        return exists
+
+    def _templates_for_value_type(self, value_type: str) -> List[Template]:
+        """The templates that may express messages of the value_type, in their original order."""
+        try:
+            return self._templates_by_value_type[value_type]
+        except KeyError:
+            templates = [template for template, prefix in self._value_type_prefixes if value_type.startswith(prefix)]
+            self._templates_by_value_type[value_type] = templates
+            return templates
 
     def all_templates_for_message(self, message: Message) -> Iterator[Template]:
-        for template in self.templates:
+        for template in self._templates_for_value_type(str(message.main_fact.value_type)):
             # See if the template can express this message (with the help of the other available messages)
             if template.check(message, self.all_messages):
                 # Got a matching template: this message can be expressed
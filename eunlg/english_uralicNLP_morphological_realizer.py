@@ -1,5 +1,6 @@
 import logging
-from typing import Dict, Optional, List
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
 
 from uralicNLP import uralicApi
 
@@ -14,10 +15,25 @@ if not uralicApi.is_language_installed("eng"):
 
 
 class EnglishUralicNLPMorphologicalRealizer(LanguageSpecificMorphologicalRealizer):
+    fst_cache_size = 4096
+
     def __init__(self):
         super().__init__("en")
 
         self.case_map: Dict[str, str] = {"genitive": "GEN"}
+        # The same entities are realized over and over, so cache the results of the (slow) FST lookups. The caches are
+        # per-instance, s.t. they're discarded along with the realizer.
+        self._cached_analyze = lru_cache(maxsize=self.fst_cache_size)(self._analyze)
+        self._cached_generate = lru_cache(maxsize=self.fst_cache_size)(self._generate)
+
+    @staticmethod
+    def _analyze(value: str) -> Tuple[Tuple[str, float], ...]:
+        # Tuples, s.t. callers can't modify the cached results
+        return tuple(tuple(analysis) for analysis in uralicApi.analyze(value, "eng"))
+
+    @staticmethod
+    def _generate(analysis: str) -> Tuple[Tuple[str, float], ...]:
+        return tuple(tuple(generation) for generation in uralicApi.generate(analysis, "eng"))
 
     def realize(self, slot: Slot, left_context: List[TemplateComponent], right_context: List[TemplateComponent]) -> str:
         case: Optional[str] = slot.attributes.get("case")
@@ -29,7 +45,7 @@ class EnglishUralicNLPMorphologicalRealizer(LanguageSpecificMorphologicalRealize
         case = self.case_map.get(case.lower(), case.upper())
         log.debug("Normalized case {} to {}".format(slot.attributes.get("case"), case))
 
-        possible_analyses = uralicApi.analyze(slot.value, "eng")
+        possible_analyses = self._cached_analyze(slot.value)
         log.debug("Identified {} possible analyses".format(len(possible_analyses)))
         if len(possible_analyses) == 0:
             log.warning(
@@ -43,7 +59,7 @@ class EnglishUralicNLPMorphologicalRealizer(LanguageSpecificMorphologicalRealize
         analysis = "{}+{}".format(analysis, case)
         log.debug("Modified analysis to {}".format(analysis))
 
-        generations = uralicApi.generate(analysis, "eng")
+        generations = self._cached_generate(analysis)
         if not generations:
             log.warning(f"Could not generate surface form for {analysis}")
             return slot.value
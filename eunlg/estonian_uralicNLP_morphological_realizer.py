@@ -1,5 +1,6 @@
 import logging
-from typing import Dict, Optional, List
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
 
 from uralicNLP import uralicApi
 
@@ -13,10 +14,25 @@ if not uralicApi.is_language_installed("est"):
 
 
 class EstonianUralicNLPMorphologicalRealizer(LanguageSpecificMorphologicalRealizer):
+    fst_cache_size = 4096
+
     def __init__(self):
         super().__init__("ee")
 
         self.case_map: Dict[str, str] = {"ssa": "Ine", "ssä": "Ine", "inessive": "Ine", "genitive": "Gen"}
+        # The same entities are realized over and over, so cache the results of the (slow) FST lookups. The caches are
+        # per-instance, s.t. they're discarded along with the realizer.
+        self._cached_analyze = lru_cache(maxsize=self.fst_cache_size)(self._analyze)
+        self._cached_generate = lru_cache(maxsize=self.fst_cache_size)(self._generate)
+
+    @staticmethod
+    def _analyze(value: str) -> Tuple[Tuple[str, float], ...]:
+        # Tuples, s.t. callers can't modify the cached results
+        return tuple(tuple(analysis) for analysis in uralicApi.analyze(value, "est"))
+
+    @staticmethod
+    def _generate(analysis: str) -> Tuple[Tuple[str, float], ...]:
+        return tuple(tuple(generation) for generation in uralicApi.generate(analysis, "est"))
 
     def realize(self, slot: Slot, left_context: List[TemplateComponent], right_context: List[TemplateComponent]) -> str:
         case: Optional[str] = slot.attributes.get("case")
@@ -28,21 +44,21 @@ class EstonianUralicNLPMorphologicalRealizer(LanguageSpecificMorphologicalRealiz
         case = self.case_map.get(case.lower(), case.capitalize())
         log.debug("Normalized case {} to {}".format(slot.attributes.get("case"), case))
 
-        possible_analyses = [
-            analysis[0]
-            for analysis in uralicApi.analyze(slot.value, "est")
-            if "Nom" in analysis[0] and "Sg" in analysis[0]
-        ]
-        log.debug("Identified {} possible analyses".format(len(possible_analyses)))
-        for analysis in possible_analyses:
-            log.debug("\t{}".format(analysis))
-        if len(possible_analyses) == 0:
+        # Only the first nominative singular analysis is used, so there's no need to look any further
+        analysis = next(
+            (
+                analysis[0]
+                for analysis in self._cached_analyze(slot.value)
+                if "Nom" in analysis[0] and "Sg" in analysis[0]
+            ),
+            None,
+        )
+        if analysis is None:
             log.warning(
                 "No valid morphological analysis for {}, unable to realize despite case attribute".format(slot.value)
             )
             return slot.value
 
-        analysis = possible_analyses[0]
         log.debug("Picked {} as the morphological analysis of {}".format(analysis, slot.value))
 
         # We only want to replace the last occurence of "Nom", as otherwise all parts of compound words, rather than
@@ -54,7 +70,7 @@ class EstonianUralicNLPMorphologicalRealizer(LanguageSpecificMorphologicalRealiz
         analysis = analysis[:gen_start_idx] + case + analysis[gen_start_idx + 4 :]  # 4 = 1 + len("Nom")
         log.debug("Modified analysis to {}".format(analysis))
 
-        generations = uralicApi.generate(analysis, "est")
+        generations = self._cached_generate(analysis)
         if not generations:
             log.warning(f"Could not generate surface form for {analysis}")
             return slot.value
@@ -1,6 +1,9 @@
 import logging
+from functools import lru_cache
 from typing import List, Optional, Tuple
 
+import numpy as np
+
 from core.document_planner import BodyDocumentPlanner, HeadlineDocumentPlanner
 from core.models import Message
 
@@ -42,8 +45,24 @@ class EUHeadlineDocumentPlanner(HeadlineDocumentPlanner):
         return _select_next_nucleus(available_message, selected_nuclei)
 
 
+@lru_cache(maxsize=4096)
+def _value_type_prefixes(value_type: str) -> Tuple[str, ...]:
+    """
+    The prefixes of the value_type ending at each of its ":"-separated fragments, longest-first. That is, "a:b:c" has
+    the prefixes "a:b:c", "a:b" and "a". There are only so many value_types, so these are only computed once each.
+    """
+    fragments = value_type.split(":")
+    return tuple(":".join(fragments[:fragment_count]) for fragment_count in range(len(fragments), 0, -1))
+
+
+def _value_type_topic(value_type: str) -> str:
+    # The topic is the prefix of (up to) the first three fragments of the value_type
+    value_type_prefixes = _value_type_prefixes(value_type)
+    return value_type_prefixes[max(len(value_type_prefixes) - 3, 0)]
+
+
 def _topic(message: Message) -> str:
-    return ":".join(message.main_fact.value_type.split(":")[:3])
+    return _value_type_topic(message.main_fact.value_type)
 
 
 def _select_next_nucleus(
@@ -128,9 +147,14 @@ def _select_satellites_for_nucleus(
     )
     satellites: List[Message] = []
 
-    # Copy, s.t. we can modify in place
-    available_core_messages = available_core_messages[:]
-    available_expanded_messages = available_expanded_messages[:]
+    # The candidates are scored as arrays, in the same order as the scored lists were built: core messages first, then
+    # expanded messages. The candidates and their base scores are fixed for the whole paragraph: selected satellites
+    # are masked out of the candidates, rather than removed.
+    candidates = [message for message in available_core_messages if message.score > 0]
+    core_candidate_count = len(candidates)
+    candidates.extend(message for message in available_expanded_messages if message.score > 0)
+    base_scores = np.array([message.score for message in candidates], dtype=float)
+    available = np.ones(len(candidates), dtype=bool)
 
     previous = nucleus
     dist_from_prev_core_message = 1
@@ -139,52 +163,41 @@ def _select_satellites_for_nucleus(
     while True:
 
         # Modify scores to account for context
-        scored_available_core_messages = [
-            (message.score, message) for message in available_core_messages if message.score > 0
-        ]
-
+        scores = base_scores.copy()
         # if expanded_msgs < core_msgs - 1:
-        scored_available_expanded_messages = [
-            ((message.score / (dist_from_prev_core_message + 1)), message)
-            for message in available_expanded_messages
-            if message.score > 0
-        ]
+        scores[core_candidate_count:] /= dist_from_prev_core_message + 1
         # else:
-        #    scored_available_expanded_messages = []
-        scored_available_messages = scored_available_core_messages + scored_available_expanded_messages
-        scores_v_nucleus = _weigh_by_analysis_similarity(scored_available_messages, nucleus)
-        scores_v_nucleus = _weigh_by_context_similarity(scores_v_nucleus, nucleus)
-        scores_v_nucleus = {message: score for (score, message) in scores_v_nucleus}
-        scores_v_prev = _weigh_by_analysis_similarity(scored_available_messages, previous)
-        scores_v_prev = _weigh_by_context_similarity(scores_v_prev, previous)
-
-        scored_available_messages = []
+        #    available[core_candidate_count:] = False
+
+        scores_v_nucleus, _ = _weigh_by_analysis_similarity(scores, candidates, nucleus)
+        scores_v_nucleus = _weigh_by_context_similarity(scores_v_nucleus, candidates, nucleus)
+        scores_v_prev, ranks_v_prev = _weigh_by_analysis_similarity(scores, candidates, previous)
+        scores_v_prev = _weigh_by_context_similarity(scores_v_prev, candidates, previous)
+
         W_NUCLEUS = 1  # Set this to >1 to increase the weight of the nucleus when comparing similarity
-        for score_v_prev, message in scores_v_prev:
-            score_v_nuc = scores_v_nucleus[message]
-            weighted_average_score = (W_NUCLEUS * score_v_nuc + score_v_prev) / (W_NUCLEUS + 1)
-            scored_available_messages.append((weighted_average_score, message))
+        weighted_average_scores = (W_NUCLEUS * scores_v_nucleus + scores_v_prev) / (W_NUCLEUS + 1)
 
         # Filter out based on thresholds
-        filtered_scored_available = [
-            (score, message)
-            for (score, message) in scored_available_messages
-            if score > SATELLITE_RELATIVE_THRESHOLD * nucleus.score or score > SATELLITE_ABSOLUTE_THRESHOLD
-        ]
+        passes_thresholds = available & (
+            (weighted_average_scores > SATELLITE_RELATIVE_THRESHOLD * nucleus.score)
+            | (weighted_average_scores > SATELLITE_ABSOLUTE_THRESHOLD)
+        )
         log.debug(
-            "After rescoring for context, {} potential satellites remain".format(len(scored_available_core_messages))
+            "After rescoring for context, {} potential satellites remain".format(
+                np.count_nonzero(available[:core_candidate_count])
+            )
         )
 
-        if not filtered_scored_available:
+        if not passes_thresholds.any():
             if len(satellites) >= MIN_SATELLITES_PER_NUCLEUS:
                 log.debug("Done with satellites: MIN_SATELLITES_PER_NUCLEUS reached, no satellites pass filter.")
                 return satellites
-            elif scored_available_messages:
+            elif available.any():
                 log.debug(
                     "No satellite candidates pass threshold but have not reached MIN_SATELLITES_PER_NUCLEUS. "
                     "Trying without filter."
                 )
-                filtered_scored_available = scored_available_messages
+                passes_thresholds = available
             else:
                 log.debug("Did not reach MIN_SATELLITES_PER_NUCLEUS, but ran out of candidates. Ending paragraphs.")
                 return satellites
@@ -193,13 +206,17 @@ def _select_satellites_for_nucleus(
             log.debug("Stopping due to having reaches MAX_SATELLITE_PER_NUCLEUS")
             return satellites
 
-        filtered_scored_available.sort(key=lambda pair: pair[0], reverse=True)
-        score, selected_satellite = filtered_scored_available[0]
+        # Select the highest scoring candidate. Ties go to the candidate that the analysis similarity to the previous
+        # message ranked first, and then to the one that came first in the candidates.
+        score = weighted_average_scores[passes_thresholds].max()
+        tied = np.flatnonzero(passes_thresholds & (weighted_average_scores == score))
+        selected_idx = tied[np.argmin(ranks_v_prev[tied])]
+        selected_satellite = candidates[selected_idx]
         satellites.append(selected_satellite)
+        available[selected_idx] = False
         log.debug("Added satellite {} (temp_score={})".format(selected_satellite, score))
 
-        if selected_satellite in available_core_messages:
-            available_core_messages = [message for message in available_core_messages if message != selected_satellite]
+        if selected_idx < core_candidate_count:
             dist_from_prev_core_message = 1
             core_msgs += 1
             log.debug(
@@ -207,9 +224,6 @@ def _select_satellites_for_nucleus(
                 + f"{selected_satellite.main_fact.value_type}"
             )
         else:
-            available_expanded_messages = [
-                message for message in available_expanded_messages if message != selected_satellite
-            ]
             dist_from_prev_core_message += 1
             expanded_msgs += 1
             log.debug(
@@ -221,59 +235,63 @@ def _select_satellites_for_nucleus(
 
 
 def _weigh_by_analysis_similarity(
-    messages: List[Tuple[float, Message]], previous: Message
-) -> List[Tuple[float, Message]]:
+    scores: np.ndarray, messages: List[Message], previous: Message
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Weighs the scores of the messages by how similar their value_types are to that of the previous message.
+
+    Also returns the rank of each message in the order the weighting considers them in: messages about a different
+    topic first, then the messages sharing each prefix of the previous value_type from the longest prefix to the
+    shortest, and last the messages sharing no prefix at all.
+    """
+    previous_value_type = previous.main_fact.value_type
+    ranks = np.fromiter(
+        (_analysis_similarity_rank(previous_value_type, message.main_fact.value_type) for message in messages),
+        dtype=int,
+        count=len(messages),
+    )
+
+    # Each message's score is weighted by 1/n where n is how many'th prefix of the previous value_type it shares.
+    # Messages about a different topic, or sharing no prefix at all, are weighted to 0.
+    shares_prefix = (ranks >= 0) & (ranks < len(_value_type_prefixes(previous_value_type)))
+    weighted = np.divide(scores, ranks + 1, out=np.zeros_like(scores), where=shares_prefix)
+    return weighted, ranks
 
-    weighted: List[Tuple[float, Message]] = []
-    unprocessed: List[Tuple[float, Message]] = []
 
+@lru_cache(maxsize=65536)
+def _analysis_similarity_rank(previous_value_type: str, value_type: str) -> int:
+    """
+    The rank of a message of the value_type when weighing it by its similarity to a message of the previous_value_type:
+    -1 for a different topic, n for sharing the (n+1)th prefix of the previous value_type, and the number of prefixes
+    for sharing no prefix at all. Only depends on the value_types, so it's computed once for each pair of them.
+    """
     # Within a paragraph, all messages must be about the same general topic,
     # i.e. have the same prefix of n (here, 3) segments.
-    filtered_messages = []
-    for score, msg in messages:
-        if _topic(msg) == _topic(previous):
-            filtered_messages.append((score, msg))
-        else:
-            weighted.append((0, msg))
-    messages = filtered_messages
+    if _value_type_topic(value_type) != _value_type_topic(previous_value_type):
+        return -1
 
     # Given that the previous message has value_type of "a:b:c:d", we start trying prefixes longest-first,
     # i.e. starting with "a:b:c:d", then "a:b:c", then "a:b" etc.
-    # Each message's score is then weighted by 1/n where n is how many'th prefix this is. That is,
-    # "a:b:c:d" -> n=1, "a:b:c" -> n=2 etc.
-    value_type_fragments = previous.main_fact.value_type.split(":")
-    for n, fragment_count in enumerate(reversed(range(len(value_type_fragments)))):
-        value_type_prefix = ":".join(value_type_fragments[: fragment_count + 1])
-
-        for score, message in messages:
-            if message.main_fact.value_type.startswith(value_type_prefix):
-                weighted.append((score / (n + 1), message))
-            else:
-                unprocessed.append((score, message))
-
-        messages, unprocessed = unprocessed, []
-
-    # Still need to process the messages which shared no prefix at all.
-    weighted.extend((0, message) for (score, message) in unprocessed)
-    return weighted
-
-
-def _weigh_by_context_similarity(
-    messages: List[Tuple[float, Message]], previous: Message
-) -> List[Tuple[float, Message]]:
-    weighted: List[Tuple[float, Message]] = []
-
-    for score, message in messages:
-        if (
-            previous.main_fact.location != message.main_fact.location
-            and previous.main_fact.timestamp != message.main_fact.timestamp
-        ):
-            score = 0
-        else:
-            if previous.main_fact.location == message.main_fact.location:
-                score *= 2
-            if previous.main_fact.timestamp == message.main_fact.timestamp:
-                score *= 1.5
+    value_type_prefixes = _value_type_prefixes(previous_value_type)
+    for n, value_type_prefix in enumerate(value_type_prefixes):
+        if value_type.startswith(value_type_prefix):
+            return n
+    return len(value_type_prefixes)
+
+
+def _weigh_by_context_similarity(scores: np.ndarray, messages: List[Message], previous: Message) -> np.ndarray:
+    same_location = np.fromiter(
+        (message.main_fact.location == previous.main_fact.location for message in messages),
+        dtype=bool,
+        count=len(messages),
+    )
+    same_timestamp = np.fromiter(
+        (message.main_fact.timestamp == previous.main_fact.timestamp for message in messages),
+        dtype=bool,
+        count=len(messages),
+    )
 
-        weighted.append((score, message))
+    weighted = np.where(same_location, scores * 2, scores)
+    weighted = np.where(same_timestamp, weighted * 1.5, weighted)
+    weighted[~same_location & ~same_timestamp] = 0
     return weighted
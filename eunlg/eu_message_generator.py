@@ -2,10 +2,10 @@ import logging
 from collections import deque
 from datetime import datetime
 from math import isnan
-from typing import List, Optional, Tuple
+from typing import Any, List, Optional, Tuple
 
 from numpy.random.mtrand import RandomState
-from pandas import Series
+from pandas import DataFrame
 
 from core.datastore import DataFrameStore
 from core.message_generator import MessageGenerator, NoMessagesForSelectionException
@@ -79,9 +79,9 @@ class EUMessageGenerator(MessageGenerator):
                 or ":outlierness" in col_name
             )
         ]
-        core_df.apply(self._gen_messages, axis=1, args=(col_names, core_messages))
+        self._gen_messages(core_df, col_names, core_messages)
         if expanded_df is not None:
-            expanded_df.apply(self._gen_messages, axis=1, args=(col_names, expanded_messages))
+            self._gen_messages(expanded_df, col_names, expanded_messages)
 
         if log.getEffectiveLevel() <= 5:
             for m in core_messages:
@@ -114,63 +114,82 @@ class EUMessageGenerator(MessageGenerator):
 
     def _gen_messages(
         self,
-        row: Series,
+        df: DataFrame,
         col_names: List[str],
         messages: List[Message],
         importance_coefficient: float = 1.0,
         polarity: float = 0.0,
     ) -> None:
-        location = row["location"]
-        location_type = row["location_type"]
-        timestamp_type = row["timestamp_type"]
-        agent = row["agent"]
-        agent_type = row["agent_type"]
-        timestamp = row["timestamp"]
-
-        if isinstance(timestamp, float):
-            timestamp = str(int(timestamp))
-
-        # Retain this + last years' monthly stuff. Skip older monthly stuff.
-        if timestamp_type == "month":
-            year, month = timestamp.split("M")
-            if int(year) < datetime.now().year - 1:
-                return
-
-        # For yearly stuff, keep the last three years.
-        elif timestamp_type == "year":
-            if int(timestamp) < datetime.now().year - 3:
-                return
-
-        for col_name in col_names:
-            value_type = col_name
-            value = row[col_name]
-
-            outlierness_col_name = col_name + ":outlierness"
-            outlierness = row.get(outlierness_col_name, None)
-
-            # There are potentially multiple outlierness values to choose from, corresponding to multiple ways of
-            # grouping the data. TODO: Smarter way to select which on the use
-            if not outlierness:
-                outlierness = row.get(col_name + ":grouped_by_time:outlierness", None)
-
-            if value is None or value == "" or (isinstance(value, float) and isnan(value)):
-                # 'value' is effectively undefined, do not REALLY generate the message.
-                continue
-
-            fact = Fact(
-                location="[ENTITY:{}:{}]".format(location_type, location),
-                location_type=location_type,
-                value=value,
-                value_type=value_type,
-                timestamp=timestamp,
-                timestamp_type=timestamp_type,
-                agent=agent,
-                agent_type=agent_type,
-                outlierness=outlierness,
+        """
+        Generates a message for each defined value in the `col_names` columns of each row of `df`, in row-major order.
+
+        The DataFrame is read column-wise into plain lists once, rather than constructing a Series for each row.
+        """
+        min_monthly_year = datetime.now().year - 1
+        min_yearly_year = datetime.now().year - 3
+
+        def optional_column(col_name: str) -> List[Any]:
+            # Missing columns behave like missing keys in a row, i.e. all values are None
+            return df[col_name].tolist() if col_name in df.columns else [None] * len(df)
+
+        value_columns = [
+            (
+                col_name,
+                df[col_name].tolist(),
+                optional_column(col_name + ":outlierness"),
+                optional_column(col_name + ":grouped_by_time:outlierness"),
             )
+            for col_name in col_names
+        ]
 
-            message = Message(facts=fact, importance_coefficient=importance_coefficient, polarity=polarity)
-            messages.append(message)
+        rows = zip(
+            *(
+                df[col_name].tolist()
+                for col_name in ["location", "location_type", "timestamp_type", "agent", "agent_type", "timestamp"]
+            )
+        )
+        for row_idx, (location, location_type, timestamp_type, agent, agent_type, timestamp) in enumerate(rows):
+            if isinstance(timestamp, float):
+                timestamp = str(int(timestamp))
+
+            # Retain this + last years' monthly stuff. Skip older monthly stuff.
+            if timestamp_type == "month":
+                year, month = timestamp.split("M")
+                if int(year) < min_monthly_year:
+                    continue
+
+            # For yearly stuff, keep the last three years.
+            elif timestamp_type == "year":
+                if int(timestamp) < min_yearly_year:
+                    continue
+
+            for value_type, values, outlierness_values, grouped_outlierness_values in value_columns:
+                value = values[row_idx]
+
+                # There are potentially multiple outlierness values to choose from, corresponding to multiple ways of
+                # grouping the data. TODO: Smarter way to select which on the use
+                outlierness = outlierness_values[row_idx]
+                if not outlierness:
+                    outlierness = grouped_outlierness_values[row_idx]
+
+                if value is None or value == "" or (isinstance(value, float) and isnan(value)):
+                    # 'value' is effectively undefined, do not REALLY generate the message.
+                    continue
+
+                fact = Fact(
+                    location="[ENTITY:{}:{}]".format(location_type, location),
+                    location_type=location_type,
+                    value=value,
+                    value_type=value_type,
+                    timestamp=timestamp,
+                    timestamp_type=timestamp_type,
+                    agent=agent,
+                    agent_type=agent_type,
+                    outlierness=outlierness,
+                )
+
+                message = Message(facts=fact, importance_coefficient=importance_coefficient, polarity=polarity)
+                messages.append(message)
 
     def _gen_messages_for_previous_location(
         self, registry: Registry, language: str, location_type: str, dataset: str, previous_location: str,
@@ -69,7 +69,7 @@ class EUEntityNameResolver(EntityNameResolver):
 
     def is_entity(self, maybe_entity: Any) -> bool:
         if not isinstance(maybe_entity, str):
-            log.debug("Value {} is not an entity".format(maybe_entity))
+            log.debug("Value %s is not an entity", maybe_entity)
             return False
         return self._matcher.fullmatch(maybe_entity) is not None
 
@@ -93,7 +93,7 @@ class EUEntityNameResolver(EntityNameResolver):
 
         realization = realizer.resolve(random, entity)
         slot.value = lambda x: realization
-        log.debug('Realizer entity "{}" of type "{}" as "{}"'.format(entity, entity_type, realization))
+        log.debug('Realizer entity "%s" of type "%s" as "%s"', entity, entity_type, realization)
 
 
 class EUEntityNameResolverComponent(ABC):
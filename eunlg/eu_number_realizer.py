@@ -5,7 +5,7 @@ from typing import Dict, Tuple, Union, cast
 
 from numpy.random import Generator
 
-from core.models import DocumentPlanNode, Slot
+from core.models import DocumentPlanNode, LiteralSource, Slot
 from core.pipeline import NLGPipelineComponent
 from core.registry import Registry
 
@@ -40,35 +40,38 @@ class EUNumberRealizer(NLGPipelineComponent):
             language = language[:-5]
             log.debug("Language had suffix '-head', removing. Result: {}".format(language))
 
-        self._recurse(registry, random, language, document_plan)
+        self._realize_ordinals(registry, random, language, document_plan)
 
         if log.isEnabledFor(logging.DEBUG):
             document_plan.print_tree()
 
         return (document_plan,)
 
-    def _recurse(
-        self, registry: Registry, random: Generator, language: str, this: DocumentPlanNode,
+    def _realize_ordinals(
+        self, registry: Registry, random: Generator, language: str, root: DocumentPlanNode,
     ):
         """
-        Traverses the DocumentPlan tree recursively in-order and modifies named
-        entity to_value functions to return the chosen form of that NE's name.
+        Traverses the DocumentPlan tree in-order and modifies the to_value functions of ordinal slots to return the
+        ordinal form of the number.
         """
         language_specific_realizers = self.realizers.get(language, {})
-        if isinstance(this, Slot):
-            this = cast(Slot, this)
-            if this.attributes and this.attributes.get("ord"):
-                realizer = language_specific_realizers.get("ord")
-                if not realizer:
-                    log.error("Wanted to realize as ordinal '{}' but found no realizer.".format(this.value))
-                else:
-                    new_value = realizer.realize(this)
-                    this.value = lambda x: new_value
-
-        elif isinstance(this, DocumentPlanNode):
-            log.debug("Visiting non-leaf '{}'".format(this))
-            for child in this.children:
-                self._recurse(registry, random, language, child)
+        # Explicit stack instead of recursion. Children are pushed in reverse s.t. they are popped in order.
+        stack = [root]
+        while stack:
+            this = stack.pop()
+            if isinstance(this, Slot):
+                this = cast(Slot, this)
+                if this.attributes and this.attributes.get("ord"):
+                    realizer = language_specific_realizers.get("ord")
+                    if not realizer:
+                        log.error("Wanted to realize as ordinal '{}' but found no realizer.".format(this.value))
+                    else:
+                        new_value = realizer.realize(this)
+                        this.value = LiteralSource(new_value)
+
+            elif isinstance(this, DocumentPlanNode):
+                log.debug("Visiting non-leaf '%s'", this)
+                stack.extend(reversed(this.children))
 
 
 class Realizer(ABC):
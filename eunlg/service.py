@@ -5,13 +5,13 @@ import pickle
 from collections import defaultdict
 from pathlib import Path
 from random import randint
-from typing import Callable, Dict, List, Optional, Tuple, TypeVar
+from typing import Callable, Dict, Iterator, List, Optional, Tuple, TypeVar
 
 from core.aggregator import Aggregator
 from core.datastore import DataFrameStore
 from core.models import Template
 from core.morphological_realizer import MorphologicalRealizer
-from core.pipeline import LanguageSplitComponent, NLGPipeline
+from core.pipeline import LanguageSplitComponent, NLGPipeline, NLGPipelineComponent
 from core.realize_slots import SlotRealizer, SlotRealizerComponent
 from core.registry import Registry
 from core.surface_realizer import BodyHTMLSurfaceRealizer, HeadlineHTMLSurfaceRealizer
@@ -56,6 +56,7 @@ from resources.health_cost_english_resource import HealthCostEnglishResource
 from resources.health_cost_finnish_resource import HealthCostFinnishResource
 from resources.health_funding_english_resource import HealthFundingEnglishResource
 from resources.health_funding_finnish_resource import HealthFundingFinnishResource
+from resources.tabular_data_resource import TabularDataResource
 from slovene_simple_morpological_realizer import SlovenianSimpleMorphologicalRealizer
 from template_attacher import TemplateAttacher
 from embedding_remover import EmbeddingRemover
@@ -64,6 +65,14 @@ log = logging.getLogger(__name__)
 
 
 class EUNlgService:
+    DATA_ROOT = Path(__file__).parent.absolute() / ".." / "data"
+
+    DATASETS = [
+        "cphi",
+        "health_cost",
+        "health_funding",
+    ]
+
     def __init__(
         self,
         random_seed: Optional[int] = None,
@@ -77,27 +86,139 @@ class EUNlgService:
         :param nomorphi: don't load Omorphi for morphological generation. This removes the dependency on Omorphi,
             so allows easier setup, but means that no morphological inflection will be performed on the output,
             which is generally a very bad thing for the full pipeline
+        :param planner: which document planner variant to use
         """
+        self.datasets = self.DATASETS[:]
+        self.resources = self._get_resources()
 
         # New registry and result importer
-        self.registry = Registry()
+        self.registry = self._build_registry()
 
-        # DataSets
-        DATA_ROOT = Path(__file__).parent.absolute() / ".." / "data"
+        # PRNG seed
+        self._set_seed(seed_val=random_seed)
 
-        self.datasets = [
-            "cphi",
-            "health_cost",
-            "health_funding",
-        ]
+        # Components that don't depend on the document planner are shared by all planner variants, see set_planner()
+        self._pre_planner_components = {
+            headline: tuple(self._get_pre_planner_components()) for headline in (False, True)
+        }  # type: Dict[bool, Tuple[NLGPipelineComponent, ...]]
+        self._post_planner_components = {
+            headline: tuple(self._get_post_planner_components(headline=headline)) for headline in (False, True)
+        }  # type: Dict[bool, Tuple[NLGPipelineComponent, ...]]
+        self.set_planner(planner)
+
+    def set_planner(self, planner: str) -> None:
+        """
+        Swap the document planner variant used by the service. The rest of the pipeline components are reused.
+
+        :param planner: which document planner variant to use
+        """
+        pipelines = {}
+        for headline in (False, True):
+            pipelines[headline] = NLGPipeline(
+                self.registry,
+                *self._pre_planner_components[headline],
+                *self._get_planner_components(headline=headline, planner=planner),
+                *self._post_planner_components[headline],
+            )
+
+        log.info("Configuring Body NLG Pipeline (planner = {})".format(planner))
+        self.planner = planner
+        self.body_pipeline = pipelines[False]
+        self.headline_pipeline = pipelines[True]
+
+    @staticmethod
+    def _get_pre_planner_components() -> Iterator[NLGPipelineComponent]:
+        yield EUMessageGenerator(expand=True)
+        yield EUImportanceSelector()
+
+    @staticmethod
+    def _get_planner_components(headline: bool = False, planner: str = "full") -> Iterator[NLGPipelineComponent]:
+        if planner == "random":
+            yield EURandomHeadlineDocumentPlanner() if headline else EURandomBodyDocumentPlanner()
+        elif planner == "score":
+            yield EUScoreHeadlineDocumentPlanner() if headline else EUScoreBodyDocumentPlanner()
+        elif planner == "earlystop":
+            yield EUEarlyStopHeadlineDocumentPlanner() if headline else EUEarlyStopBodyDocumentPlanner()
+        elif planner == "topicsim":
+            yield EUTopicSimHeadlineDocumentPlanner() if headline else EUTopicSimBodyDocumentPlanner()
+        elif planner == "contextsim":
+            yield EUContextSimHeadlineDocumentPlanner() if headline else EUContextSimBodyDocumentPlanner()
+        elif planner == "neuralsim":
+            if headline:
+                yield EUHeadlineDocumentPlanner()
+            else:
+                yield TemplateAttacher()
+                yield EUNeuralSimBodyDocumentPlanner()
+                yield EmbeddingRemover()
+
+        elif planner == "full":
+            yield EUHeadlineDocumentPlanner() if headline else EUBodyDocumentPlanner()
+        else:
+            raise ValueError("INCORRECT PLANNER SETTING")
+
+    @staticmethod
+    def _get_post_planner_components(headline: bool = False) -> Iterator[NLGPipelineComponent]:
+        yield TemplateSelector()
+        yield Aggregator()
+        yield SlotRealizer()
+        yield LanguageSplitComponent(
+            {
+                "en": EnglishEUDateRealizer(),
+                "fi": FinnishEUDateRealizer(),
+                "hr": CroatianEUDateRealizer(),
+                "de": GermanEUDateRealizer(),
+                "ru": RussianEUDateRealizer(),
+                "ee": EstonianEUDateRealizer(),
+                "sl": SlovenianEUDateRealizer(),
+            }
+        )
+        yield EUEntityNameResolver()
+        yield EUNumberRealizer()
+        yield MorphologicalRealizer(
+            {
+                "en": EnglishUralicNLPMorphologicalRealizer(),
+                "fi": FinnishUralicNLPMorphologicalRealizer(),
+                "hr": CroatianSimpleMorphologicalRealizer(),
+                "ru": RussianMorphologicalRealizer(),
+                "ee": EstonianUralicNLPMorphologicalRealizer(),
+                "sl": SlovenianSimpleMorphologicalRealizer(),
+            }
+        )
+        yield HeadlineHTMLSurfaceRealizer() if headline else BodyHTMLSurfaceRealizer()
+
+    def _build_registry(self) -> Registry:
+        """
+        Build a registry containing all the variant-independent components: datastores, templates, slot realizers
+        and language metadata.
+        """
+        registry = Registry()
+
+        # DataSets
         for dataset in self.datasets:
-            cache_path: Path = (DATA_ROOT / "{}.cache".format(dataset)).absolute()
+            cache_path: Path = (self.DATA_ROOT / "{}.cache".format(dataset)).absolute()
             if not cache_path.exists():
                 raise IOError("No cached dataset found at {}. Datasets must be generated before startup.")
-            self.registry.register("{}-data".format(dataset), DataFrameStore(str(cache_path)))
+            registry.register("{}-data".format(dataset), DataFrameStore(str(cache_path)))
 
-        # Resources
-        self.resources = [
+        # Templates
+        registry.register("templates", self._load_templates(self.resources))
+
+        # Slot Realizers:
+        realizers: List[SlotRealizerComponent] = []
+        for resource in self.resources:
+            for realizer in resource.slot_realizer_components():
+                realizers.append(realizer(registry))
+        registry.register("slot-realizers", realizers)
+
+        # Language metadata
+        registry.register("conjunctions", CONJUNCTIONS)
+        registry.register("errors", ERRORS)
+
+        return registry
+
+    @staticmethod
+    def _get_resources() -> List[TabularDataResource]:
+        return [
             CPHIEnglishResource(),
             CPHIFinnishResource(),
             CPHICroatianResource(),
@@ -112,82 +233,6 @@ class EUNlgService:
             HealthFundingFinnishResource(),
         ]
 
-        # Templates
-        self.registry.register("templates", self._load_templates())
-
-        # Slot Realizers:
-        realizers: List[SlotRealizerComponent] = []
-        for resource in self.resources:
-            for realizer in resource.slot_realizer_components():
-                realizers.append(realizer(self.registry))
-        self.registry.register("slot-realizers", realizers)
-
-        # Language metadata
-        self.registry.register("conjunctions", CONJUNCTIONS)
-        self.registry.register("errors", ERRORS)
-
-        # PRNG seed
-        self._set_seed(seed_val=random_seed)
-
-        def _get_components(headline=False, planner="full"):
-            # Put together the list of components
-            # This varies depending on whether it's for headlines and which language we are doing stuff in
-            yield EUMessageGenerator(expand=True)
-            yield EUImportanceSelector()
-            if planner == "random":
-                yield EURandomHeadlineDocumentPlanner() if headline else EURandomBodyDocumentPlanner()
-            elif planner == "score":
-                yield EUScoreHeadlineDocumentPlanner() if headline else EUScoreBodyDocumentPlanner()
-            elif planner == "earlystop":
-                yield EUEarlyStopHeadlineDocumentPlanner() if headline else EUEarlyStopBodyDocumentPlanner()
-            elif planner == "topicsim":
-                yield EUTopicSimHeadlineDocumentPlanner() if headline else EUTopicSimBodyDocumentPlanner()
-            elif planner == "contextsim":
-                yield EUContextSimHeadlineDocumentPlanner() if headline else EUContextSimBodyDocumentPlanner()
-            elif planner == "neuralsim":
-                if headline:
-                    yield EUHeadlineDocumentPlanner()
-                else:
-                    yield TemplateAttacher()
-                    yield EUNeuralSimBodyDocumentPlanner()
-                    yield EmbeddingRemover()
-
-            elif planner == "full":
-                yield EUHeadlineDocumentPlanner() if headline else EUBodyDocumentPlanner()
-            else:
-                raise ValueError("INCORRECT PLANNER SETTING")
-            yield TemplateSelector()
-            yield Aggregator()
-            yield SlotRealizer()
-            yield LanguageSplitComponent(
-                {
-                    "en": EnglishEUDateRealizer(),
-                    "fi": FinnishEUDateRealizer(),
-                    "hr": CroatianEUDateRealizer(),
-                    "de": GermanEUDateRealizer(),
-                    "ru": RussianEUDateRealizer(),
-                    "ee": EstonianEUDateRealizer(),
-                    "sl": SlovenianEUDateRealizer(),
-                }
-            )
-            yield EUEntityNameResolver()
-            yield EUNumberRealizer()
-            yield MorphologicalRealizer(
-                {
-                    "en": EnglishUralicNLPMorphologicalRealizer(),
-                    "fi": FinnishUralicNLPMorphologicalRealizer(),
-                    "hr": CroatianSimpleMorphologicalRealizer(),
-                    "ru": RussianMorphologicalRealizer(),
-                    "ee": EstonianUralicNLPMorphologicalRealizer(),
-                    "sl": SlovenianSimpleMorphologicalRealizer(),
-                }
-            )
-            yield HeadlineHTMLSurfaceRealizer() if headline else BodyHTMLSurfaceRealizer()
-
-        log.info("Configuring Body NLG Pipeline (planner = {})".format(planner))
-        self.body_pipeline = NLGPipeline(self.registry, *_get_components(planner=planner))
-        self.headline_pipeline = NLGPipeline(self.registry, *_get_components(headline=True, planner=planner))
-
     T = TypeVar("T")
 
     def _get_cached_or_compute(
@@ -210,10 +255,11 @@ class EUNlgService:
             with gzip.open(cache, "rb") as f:
                 return pickle.load(f)
 
-    def _load_templates(self) -> Dict[str, List[Template]]:
+    @staticmethod
+    def _load_templates(resources: List[TabularDataResource]) -> Dict[str, List[Template]]:
         log.info("Loading templates")
         templates: Dict[str, List[Template]] = defaultdict(list)
-        for resource in self.resources:
+        for resource in resources:
             for language, new_templates in read_templates(resource.templates)[0].items():
                 templates[language].extend(new_templates)
 
@@ -1,9 +1,9 @@
 import gzip
-import pickle
 from pathlib import Path
 
 import pandas as pd
 import requests
+from pyarrow import feather
 
 from cphi_preprocessor import CPHIPreprocessor
 from health_cost_preprocessor import HealthCostPreprocessor
@@ -41,10 +41,9 @@ def run():
         with gzip.open(gz_path, "rb") as gz_handle, open(tsv_path, "wb") as tsv_handle:
             tsv_handle.write(gz_handle.read())
 
-        with gzip.open(cache_path, "wb") as cache_handle:
-            df = pd.read_csv(tsv_path, sep="\t")
-            df = details["preprocessor"].process(df)
-            pickle.dump(df, cache_handle)
+        df = pd.read_csv(tsv_path, sep="\t")
+        df = details["preprocessor"].process(df)
+        feather.write_feather(df, str(cache_path), compression="zstd")
         print("\tPreprocessing complete")
 
 